@@ -1,32 +1,36 @@
+import base64
 import hashlib
-import requests
+import hmac
+import httpx
 import os
-from pymongo import MongoClient
+from pymongo import UpdateOne, ReturnDocument, IndexModel, ASCENDING, DESCENDING
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Cookie, WebSocket
+from fastapi import FastAPI, HTTPException, Cookie, WebSocket, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from datetime import datetime, timedelta
-from typing import List, Optional
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
 from bson import ObjectId
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
 import certifi
-import openai
 import tempfile
-from openai import OpenAI
-from pydub import AudioSegment
-from pydub.utils import which
-from pydub.utils import mediainfo
 import time
-from groq import Groq
 import asyncio
 import re
+import json
+import bisect
+import gzip
 import secrets
-import gridfs
-from io import BytesIO
+import socket
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from pymongo import monitoring
+from pymongo.errors import DuplicateKeyError, BulkWriteError, OperationFailure
+from gridfs.errors import NoFile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from fastapi.responses import StreamingResponse
 
 # Model used to Capture user sign up credentials.
@@ -72,133 +76,1277 @@ class VerifyConfirmationCodeRequest(BaseModel):
     email: str
     code: str
 
+# Model used to mark several articles as read in one request
+class ArticleReadState(BaseModel):
+    url: str
+    readingTime: int = 0
+
+class MarkAsReadBatchRequest(BaseModel):
+    articles: List[ArticleReadState]
+
+# Models used to award points to many users at once (e.g. streak bonuses)
+class PointsAward(BaseModel):
+    username: str
+    points: int
+    idempotency_key: Optional[str] = None
+
+class PointsBulkAwardRequest(BaseModel):
+    reason: str
+    awards: List[PointsAward]
+
+# Startup only schedules work: Mongo is warmed up (ping, migrations, indexes) in the background so the
+# process starts serving straight away, and /readyz reports when that has finished. See Resources below.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    resources.start()
+    try:
+        yield
+    finally:
+        await resources.close()
+
 # loading the env variables and starting the fastapi
 load_dotenv()
-fast_app = FastAPI()
+fast_app = FastAPI(lifespan=lifespan)
+
+# In-process metrics in the Prometheus text format, served on /metrics. Updates are a dict lookup and a few
+# additions under a lock (the Mongo listener runs on driver threads), so they are cheap enough for every request.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+metrics_registry = []
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+        self.lock = threading.Lock()
+        metrics_registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.values = {}
+        self.lock = threading.Lock()
+        metrics_registry.append(self)
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (bucket_counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    labels = format_labels(self.labelnames + ("le",), key + (repr(float(bound)),))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = format_labels(self.labelnames + ("le",), key + ("+Inf",))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                lines.append(f"{self.name}_sum{format_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{format_labels(self.labelnames, key)} {count}")
+        return lines
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+http_request_seconds = Histogram(
+    "http_request_duration_seconds", "Time to produce a response (headers) per route", ("method", "route", "status")
+)
+mongo_command_seconds = Histogram("mongo_command_duration_seconds", "MongoDB command latency", ("command", "outcome"))
+upstream_request_seconds = Histogram(
+    "upstream_request_duration_seconds", "Latency of calls to external services", ("upstream", "operation", "outcome")
+)
+llm_tokens_total = Counter("llm_tokens_total", "Tokens reported by the LLM APIs", ("model", "kind"))
+tts_bytes_total = Counter("tts_audio_bytes_total", "Audio bytes returned by text-to-speech")
+gridfs_bytes_total = Counter("gridfs_bytes_total", "Bytes written to and read from GridFS", ("direction",))
+mail_recipients_total = Counter("mail_recipients_total", "E-mail recipients handed to the mail transport", ("outcome",))
+cache_requests_total = Counter("cache_requests_total", "Cache lookups by cache and result", ("cache", "result"))
+summary_batch_articles_total = Counter(
+    "summary_batch_articles_total", "Articles summarized by a batch call or by the per-article fallback", ("outcome",)
+)
+
+# Times a block that calls an external service; the outcome label is "error" if the block raises
+@contextmanager
+def track_upstream(upstream: str, operation: str):
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        upstream_request_seconds.observe(time.perf_counter() - start, upstream=upstream, operation=operation, outcome=outcome)
+
+def record_llm_usage(model: str, usage):
+    if usage is not None:
+        llm_tokens_total.inc(getattr(usage, "prompt_tokens", 0) or 0, model=model, kind="prompt")
+        llm_tokens_total.inc(getattr(usage, "completion_tokens", 0) or 0, model=model, kind="completion")
+
+# Records the duration of every command the Mongo driver runs
+class MongoCommandMetrics(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_command_seconds.observe(event.duration_micros / 1e6, command=event.command_name, outcome="ok")
+
+    def failed(self, event):
+        mongo_command_seconds.observe(event.duration_micros / 1e6, command=event.command_name, outcome="error")
+
+# Times every request by its route template (e.g. /news/{username}), so per-user URLs share one series.
+# For streamed responses this measures the time to the first byte.
+@fast_app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        http_request_seconds.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status
+        )
 
 # connect to database (mongoDB)
 MONGO_URI = os.getenv("MONGO_URI")
 NEWS_API_KEY = os.getenv("NEWS_API_KEY")
-openai.api_key = os.getenv("openai.api_key")
 
-client = MongoClient(MONGO_URI, tlsCAFile=certifi.where())
-db = client['news_app']
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "news_app")
+MONGO_TLS = os.getenv("MONGO_TLS", "true").lower() == "true"  # false for a local mongod, e.g. in benchmarks
+
+# All I/O goes through async clients so that one slow upstream never blocks the event loop.
+# connect=False: nothing touches the network until the first operation (or the warm-up in Resources).
+client = AsyncIOMotorClient(
+    MONGO_URI,
+    connect=False,
+    event_listeners=[MongoCommandMetrics()] if METRICS_ENABLED else [],
+    **({"tlsCAFile": certifi.where()} if MONGO_TLS else {})
+)
+db = client[MONGO_DB_NAME]
 users_collection = db['users']
 news_articles_collection = db['news_articles']
-fs = gridfs.GridFS(db)
+fs = AsyncIOMotorGridFSBucket(db)
 grok_api_key = os.environ.get("GROQ_API_KEY")
-grok_client = Groq(api_key=grok_api_key)
+WARMUP_RETRY_MAX_SECONDS = float(os.getenv("WARMUP_RETRY_MAX_SECONDS", 30))
+READINESS_PING_TIMEOUT_SECONDS = float(os.getenv("READINESS_PING_TIMEOUT_SECONDS", 2))
+
+# Process-wide resources with a lifecycle. The LLM SDKs are imported and built on first use, since importing
+# them is a large share of the cold start and many workers never need them; Mongo is warmed up in the background.
+class Resources:
+    def __init__(self):
+        self._groq_client = None
+        self._openai_client = None
+        self.ready = False
+        self.warmup_error = None
+        self.warmup_seconds = None
+
+    # Base URLs can be pointed at local stand-ins (see fake_upstreams.py); unset means the real services
+    @property
+    def groq_client(self):
+        if self._groq_client is None:
+            from groq import AsyncGroq
+            self._groq_client = AsyncGroq(api_key=grok_api_key, base_url=os.getenv("GROQ_BASE_URL"))
+        return self._groq_client
+
+    @property
+    def openai_client(self):
+        if self._openai_client is None:
+            from openai import AsyncOpenAI
+            self._openai_client = AsyncOpenAI(api_key=os.getenv("openai.api_key"), base_url=os.getenv("OPENAI_BASE_URL"))
+        return self._openai_client
+
+    def start(self):
+        start_background_jobs()
+        start_background_task(self.warm_up())
+
+    # Connects to Mongo and applies migrations and indexes, retrying with backoff while Mongo is unavailable
+    # instead of failing the worker. The process is ready once this has succeeded.
+    async def warm_up(self):
+        started = time.perf_counter()
+        delay = 0.5
+        while True:
+            try:
+                await client.admin.command("ping")
+                await migrate_database()
+                break
+            except Exception as e:
+                self.warmup_error = str(e)
+                print(f"Warm-up failed, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, WARMUP_RETRY_MAX_SECONDS)
+        self.warmup_error = None
+        self.warmup_seconds = time.perf_counter() - started
+        self.ready = True
+        print(f"Warm-up finished in {self.warmup_seconds:.2f}s")
+
+    async def close(self):
+        for task in list(background_tasks):
+            task.cancel()
+        await http_client.aclose()
+        for llm_client in (self._groq_client, self._openai_client):
+            if llm_client is not None:
+                await llm_client.close()
+        client.close()
+        password_executor.shutdown(wait=False)
+
+resources = Resources()
+
+# Pooled HTTP client shared by every outgoing NewsAPI request
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+http_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(float(os.getenv("HTTP_TIMEOUT_SECONDS", 15))),
+    limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS // 5)
+)
 
 temp_users_collection = db['temp_users']
 
-# uniqueness of email and username maintained
-users_collection.create_index([("email", 1)], unique=True)
-users_collection.create_index([("username", 1)], unique=True)
-NEWS_API_URL = "https://newsapi.org/v2/top-headlines"
+NEWS_API_BASE_URL = os.getenv("NEWS_API_BASE_URL", "https://newsapi.org/v2").rstrip("/")
+NEWS_API_URL = f"{NEWS_API_BASE_URL}/top-headlines"
+
+# Headline pools shared by every user subscribed to the same source set
+HEADLINE_PAGE_SIZE = int(os.getenv("HEADLINE_PAGE_SIZE", 100))
+HEADLINE_MAX_PAGES = int(os.getenv("HEADLINE_MAX_PAGES", 3))
+HEADLINE_POOL_MIN_SIZE = int(os.getenv("HEADLINE_POOL_MIN_SIZE", 30))
+HEADLINE_CACHE_TTL_SECONDS = int(os.getenv("HEADLINE_CACHE_TTL_SECONDS", 900))
+HEADLINE_REFRESH_INTERVAL_SECONDS = int(os.getenv("HEADLINE_REFRESH_INTERVAL_SECONDS", 600))
+HEADLINE_ACTIVE_WINDOW_SECONDS = int(os.getenv("HEADLINE_ACTIVE_WINDOW_SECONDS", 24 * 3600))
+headline_pools = {}
+inflight_tasks = {}
+
+# Where state shared between workers lives. "memory" is for a single process. "mongo" is for several
+# workers or nodes (see gunicorn.conf.py): locks are Mongo leases, headline pools and podcast jobs are
+# stored in Mongo, and periodic jobs (digests, refreshers) run on one elected worker at a time.
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+if STATE_BACKEND not in ("memory", "mongo"):
+    raise ValueError(f"STATE_BACKEND must be 'memory' or 'mongo', not {STATE_BACKEND!r}")
+headline_pools_collection = db['headline_pools']
+podcast_jobs_collection = db['podcast_jobs']
+migrations_collection = db['migrations']
+PODCAST_JOB_POLL_SECONDS = float(os.getenv("PODCAST_JOB_POLL_SECONDS", 2))
+
+# Mongo-backed leases so that concurrent feed/podcast builds are deduplicated across uvicorn workers too
+USE_MONGO_LEASES = os.getenv("USE_MONGO_LEASES", str(STATE_BACKEND == "mongo")).lower() == "true"
+LEASE_TTL_SECONDS = int(os.getenv("LEASE_TTL_SECONDS", 120))
+LEASE_POLL_INTERVAL_SECONDS = float(os.getenv("LEASE_POLL_INTERVAL_SECONDS", 0.5))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+leases_collection = db['leases']
+
+# Podcast audio is streamed from GridFS in chunks of this size
+AUDIO_STREAM_CHUNK_SIZE = int(os.getenv("AUDIO_STREAM_CHUNK_SIZE", 256 * 1024))
+AUDIO_CACHE_MAX_AGE_SECONDS = int(os.getenv("AUDIO_CACHE_MAX_AGE_SECONDS", 7 * 24 * 3600))
+
+# Streaming podcast mode: script segment sizes (in characters) and how many TTS calls run at once
+PODCAST_FIRST_SEGMENT_CHARS = int(os.getenv("PODCAST_FIRST_SEGMENT_CHARS", 250))
+PODCAST_SEGMENT_CHARS = int(os.getenv("PODCAST_SEGMENT_CHARS", 800))
+PODCAST_TTS_CONCURRENCY = int(os.getenv("PODCAST_TTS_CONCURRENCY", 4))
+
+# Background podcast generation after each feed refresh. Users who logged in recently are served first,
+# and users inactive for longer than PODCAST_PRECOMPUTE_ACTIVE_DAYS are skipped so we don't pay for unheard audio.
+PODCAST_PRECOMPUTE_ENABLED = os.getenv("PODCAST_PRECOMPUTE_ENABLED", "true").lower() == "true"
+PODCAST_PRECOMPUTE_WORKERS = int(os.getenv("PODCAST_PRECOMPUTE_WORKERS", 2))
+PODCAST_PRECOMPUTE_ACTIVE_DAYS = int(os.getenv("PODCAST_PRECOMPUTE_ACTIVE_DAYS", 7))
+PODCAST_QUEUE_MAX_SIZE = int(os.getenv("PODCAST_QUEUE_MAX_SIZE", 1000))
+podcast_queue = None
+podcast_jobs = set()
+podcast_job_counter = 0
+
+MARK_AS_READ_BATCH_LIMIT = int(os.getenv("MARK_AS_READ_BATCH_LIMIT", 100))
+
+# Per-user, per-day reading counters that survive feed refreshes
+reading_stats_collection = db['reading_stats']
+READING_HISTORY_MAX_DAYS = int(os.getenv("READING_HISTORY_MAX_DAYS", 90))
+
+DASHBOARD_GZIP_MINIMUM_SIZE = int(os.getenv("DASHBOARD_GZIP_MINIMUM_SIZE", 500))
+
+# Append-only record of every points award, used for auditing and to make retried awards idempotent
+points_ledger_collection = db['points_ledger']
+POINTS_BULK_LIMIT = int(os.getenv("POINTS_BULK_LIMIT", 1000))
+
+# Leaderboards: top-N comes straight off the (field, username) indexes, ranks come from a periodically rebuilt snapshot
+LEADERBOARD_FIELDS = ("points", "streak")
+LEADERBOARD_MAX_LIMIT = int(os.getenv("LEADERBOARD_MAX_LIMIT", 100))
+LEADERBOARD_REFRESH_SECONDS = int(os.getenv("LEADERBOARD_REFRESH_SECONDS", 60))
+rank_snapshots = {}
+
+# News source catalogue, cached in memory with a persisted copy in Mongo; NewsAPI changes it about once a day
+SOURCE_CATALOGUE_TTL_SECONDS = int(os.getenv("SOURCE_CATALOGUE_TTL_SECONDS", 24 * 3600))
+SOURCE_CATALOGUE_REFRESH_SECONDS = int(os.getenv("SOURCE_CATALOGUE_REFRESH_SECONDS", 3600))
+news_sources_collection = db['news_sources']
+source_catalogue = None
+
+# Admin export of news documents
+EXPORT_MAX_PAGE_SIZE = int(os.getenv("EXPORT_MAX_PAGE_SIZE", 500))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 200))
+
+# How many article summaries may be requested from the LLM at the same time, and how long each may take
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", 10))
+SUMMARY_TIMEOUT_SECONDS = float(os.getenv("SUMMARY_TIMEOUT_SECONDS", 20))
+
+# Batched summarization: several articles per JSON-mode LLM call, sized to fit the model's context window
+SUMMARY_BATCH_MODE = os.getenv("SUMMARY_BATCH_MODE", "true").lower() == "true"
+SUMMARY_MODEL_CONTEXT_TOKENS = int(os.getenv("SUMMARY_MODEL_CONTEXT_TOKENS", 8192))
+SUMMARY_BATCH_MAX_ARTICLES = int(os.getenv("SUMMARY_BATCH_MAX_ARTICLES", 10))
+SUMMARY_BATCH_OUTPUT_TOKENS_PER_ARTICLE = int(os.getenv("SUMMARY_BATCH_OUTPUT_TOKENS_PER_ARTICLE", 250))
+# Output reserved per article for the styles that run longer than a short summary
+SUMMARY_BATCH_OUTPUT_TOKENS_BY_STYLE = {"Detailed": 600, "Storytelling": 800, "Poetic": 600}
+SUMMARY_BATCH_TIMEOUT_SECONDS = float(os.getenv("SUMMARY_BATCH_TIMEOUT_SECONDS", 45))
+
+# Shared summary cache: an in-process LRU in front of the summaries collection, which expires entries by TTL
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", 5000))
+SUMMARY_CACHE_TTL_SECONDS = int(os.getenv("SUMMARY_CACHE_TTL_SECONDS", 3 * 24 * 3600))
+summaries_collection = db['summaries']
+summary_cache = OrderedDict()
+
+# Digest e-mails are sent by a background scheduler rather than during login
+DIGEST_SCHEDULER_ENABLED = os.getenv("DIGEST_SCHEDULER_ENABLED", "true").lower() == "true"
+DIGEST_SCHEDULER_INTERVAL_SECONDS = int(os.getenv("DIGEST_SCHEDULER_INTERVAL_SECONDS", 300))
+DIGEST_BATCH_SIZE = int(os.getenv("DIGEST_BATCH_SIZE", 20))
+background_tasks = set()
+
+# Outgoing e-mail goes through a Mongo outbox. Workers send messages with identical content in one SendGrid
+# request (one personalization per recipient), retry failures with backoff and pause when rate limited.
+# MAIL_TRANSPORT=local keeps sent messages in local_mailbox instead of calling SendGrid.
+MAIL_TRANSPORT = os.getenv("MAIL_TRANSPORT", "sendgrid")
+SENDGRID_API_URL = os.getenv("SENDGRID_API_URL", "https://api.sendgrid.com/v3/mail/send")
+SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY")
+SENDGRID_FROM_EMAIL = os.getenv("SENDGRID_FROM_EMAIL")
+MAIL_WORKERS = int(os.getenv("MAIL_WORKERS", 2))
+MAIL_BATCH_SIZE = min(int(os.getenv("MAIL_BATCH_SIZE", 1000)), 1000)  # SendGrid allows 1000 personalizations per request
+MAIL_POLL_INTERVAL_SECONDS = float(os.getenv("MAIL_POLL_INTERVAL_SECONDS", 5))
+MAIL_CLAIM_TIMEOUT_SECONDS = int(os.getenv("MAIL_CLAIM_TIMEOUT_SECONDS", 120))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", 5))
+MAIL_RETRY_BASE_SECONDS = float(os.getenv("MAIL_RETRY_BASE_SECONDS", 2))
+MAIL_OUTBOX_RETENTION_SECONDS = int(os.getenv("MAIL_OUTBOX_RETENTION_SECONDS", 7 * 24 * 3600))
+mail_outbox_collection = db['mail_outbox']
+mail_wakeup = None
+local_mailbox = []
+
+# Passwords are hashed with scrypt. Each hash costs ~128 * N * r bytes of memory and tens of milliseconds of CPU,
+# so hashing runs on a bounded thread pool (hashlib.scrypt releases the GIL) rather than on the event loop.
+# Size the pool and cost with password_benchmark.py. Raising the cost later is safe: older hashes are upgraded on login.
+PASSWORD_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", 2 ** 14))
+PASSWORD_SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", 8))
+PASSWORD_SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", 1))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 2))
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+# Retention for documents that are only useful for a while
+TEMP_USER_TTL_SECONDS = int(os.getenv("TEMP_USER_TTL_SECONDS", 24 * 3600))
+PODCAST_TTL_SECONDS = int(os.getenv("PODCAST_TTL_SECONDS", 30 * 24 * 3600))
+INDEX_REPORT_ON_STARTUP = os.getenv("INDEX_REPORT_ON_STARTUP", "false").lower() == "true"
+AUDIO_SWEEP_INTERVAL_SECONDS = int(os.getenv("AUDIO_SWEEP_INTERVAL_SECONDS", 6 * 3600))
+AUDIO_SWEEP_BATCH_SIZE = int(os.getenv("AUDIO_SWEEP_BATCH_SIZE", 500))
+
+# Every index the hot query paths rely on, per collection. apply_index_plan() creates them idempotently at startup.
+INDEX_PLAN = {
+    "users": [
+        # uniqueness of email and username maintained
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("username", ASCENDING)], unique=True),
+        # due-digest lookups go through one index range per frequency value
+        IndexModel([("preferences.frequency", ASCENDING), ("last_email_sent", ASCENDING)]),
+        # leaderboards
+        IndexModel([("points", DESCENDING), ("username", ASCENDING)]),
+        IndexModel([("streak", DESCENDING), ("username", ASCENDING)]),
+    ],
+    "news_articles": [
+        IndexModel([("username", ASCENDING)], unique=True),
+        IndexModel([("fetched_at", ASCENDING)]),
+    ],
+    "podcasts": [
+        IndexModel([("username", ASCENDING), ("fingerprint", ASCENDING)]),
+        IndexModel([("audio_file_id", ASCENDING)]),  # orphaned-audio sweep
+        IndexModel([("created_at", ASCENDING)], expireAfterSeconds=PODCAST_TTL_SECONDS),
+    ],
+    "temp_users": [
+        IndexModel([("email", ASCENDING)]),
+        IndexModel([("created_at", ASCENDING)], expireAfterSeconds=TEMP_USER_TTL_SECONDS),
+    ],
+    "summaries": [
+        IndexModel([("created_at", ASCENDING)], expireAfterSeconds=SUMMARY_CACHE_TTL_SECONDS),
+    ],
+    "leases": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "mail_outbox": [
+        # workers pick the oldest due message, then every due message with the same content
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)]),
+        IndexModel([("content_key", ASCENDING), ("status", ASCENDING), ("next_attempt_at", ASCENDING)]),
+        IndexModel([("claim", ASCENDING)], sparse=True),
+        IndexModel([("finished_at", ASCENDING)], expireAfterSeconds=MAIL_OUTBOX_RETENTION_SECONDS),
+    ],
+    "podcast_jobs": [
+        IndexModel([("status", ASCENDING), ("priority", ASCENDING)]),
+    ],
+    "reading_stats": [
+        IndexModel([("username", ASCENDING), ("day", ASCENDING)]),
+    ],
+    "points_ledger": [
+        IndexModel(
+            [("idempotency_key", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"idempotency_key": {"$type": "string"}}
+        ),
+        IndexModel([("username", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+}
+
+# Indexes from earlier versions that the plan above makes redundant
+OBSOLETE_INDEXES = {
+    "news_articles": ["username_1_articles.url_1"],
+}
+
+# One representative query per hot path, used for the explain() report
+HOT_PATH_QUERIES = [
+    ("login / profile lookup", "users", {"username": ""}, None),
+    ("signup e-mail check", "users", {"email": ""}, None),
+    ("digest due check", "users", {"preferences.frequency": 24, "last_email_sent": {"$lte": datetime(2000, 1, 1)}}, None),
+    ("points leaderboard", "users", {}, [("points", DESCENDING), ("username", ASCENDING)]),
+    ("streak leaderboard", "users", {}, [("streak", DESCENDING), ("username", ASCENDING)]),
+    ("feed lookup", "news_articles", {"username": ""}, None),
+    ("export by fetch time", "news_articles", {"fetched_at": {"$gte": datetime(2000, 1, 1)}}, [("_id", ASCENDING)]),
+    ("podcast cache lookup", "podcasts", {"username": "", "fingerprint": ""}, None),
+    ("confirmation lookup", "temp_users", {"email": ""}, None),
+    ("reading history", "reading_stats", {"username": "", "day": {"$gte": ""}}, [("day", ASCENDING)]),
+    ("points idempotency check", "points_ledger", {"idempotency_key": ""}, None),
+]
+
+# Data fixes that have to run before the index plan can be applied
+async def run_migrations():
+    # A unique index on news_articles.username needs duplicates gone first; the most recent feed is kept
+    duplicates = news_articles_collection.aggregate([
+        {"$sort": {"fetched_at": -1}},
+        {"$group": {"_id": "$username", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ])
+    async for duplicate in duplicates:
+        result = await news_articles_collection.delete_many({"_id": {"$in": duplicate["ids"][1:]}})
+        print(f"Removed {result.deleted_count} duplicate news documents for {duplicate['_id']}")
+
+    # TTL indexes only work on dates, and podcasts used to store created_at as a Unix timestamp
+    result = await db.podcasts.update_many(
+        {"created_at": {"$type": "double"}},
+        [{"$set": {"created_at": {"$toDate": {"$multiply": ["$created_at", 1000]}}}}]
+    )
+    if result.modified_count:
+        print(f"Converted created_at to a date on {result.modified_count} podcasts")
+
+    for collection_name, index_names in OBSOLETE_INDEXES.items():
+        existing = await db[collection_name].index_information()
+        for index_name in index_names:
+            if index_name in existing:
+                await db[collection_name].drop_index(index_name)
+                print(f"Dropped obsolete index {collection_name}.{index_name}")
+
+# Creates every index in INDEX_PLAN. Creating an index that already exists is a no-op; if only the TTL
+# of an existing index changed, it is updated in place with collMod instead of failing startup.
+async def apply_index_plan():
+    for collection_name, models in INDEX_PLAN.items():
+        for model in models:
+            try:
+                await db[collection_name].create_indexes([model])
+            except OperationFailure as e:
+                options = model.document
+                if e.code in (85, 86) and "expireAfterSeconds" in options:
+                    await db.command(
+                        "collMod", collection_name,
+                        index={"keyPattern": options["key"], "expireAfterSeconds": options["expireAfterSeconds"]}
+                    )
+                    print(f"Updated TTL of {collection_name}.{options['name']}")
+                else:
+                    print(f"Error creating index {collection_name}.{options['name']}: {e}")
+
+# Deletes the files in one batch of old GridFS ids that no podcasts document references. One indexed $in
+# lookup per batch, then the chunks and the files; deleting chunks first means a sweep that dies halfway
+# leaves files that the next sweep still finds.
+async def delete_orphaned_audio_batch(file_ids: list) -> int:
+    referenced_ids = set(await db.podcasts.distinct("audio_file_id", {"audio_file_id": {"$in": file_ids}}))
+    orphaned_ids = [file_id for file_id in file_ids if file_id not in referenced_ids]
+    if not orphaned_ids:
+        return 0
+    await db["fs.chunks"].delete_many({"files_id": {"$in": orphaned_ids}})
+    result = await db["fs.files"].delete_many({"_id": {"$in": orphaned_ids}})
+    return result.deleted_count
+
+# Deletes podcast audio whose podcasts document is gone (e.g. removed by the TTL index). Old files are walked
+# AUDIO_SWEEP_BATCH_SIZE at a time, so memory and query size stay bounded however many podcasts there are.
+async def sweep_orphaned_audio():
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=PODCAST_TTL_SECONDS)
+    deleted = 0
+    batch = []
+    cursor = db["fs.files"].find({"uploadDate": {"$lt": cutoff}}, {"_id": 1}, batch_size=AUDIO_SWEEP_BATCH_SIZE)
+    async for audio_file in cursor:
+        batch.append(audio_file["_id"])
+        if len(batch) >= AUDIO_SWEEP_BATCH_SIZE:
+            deleted += await delete_orphaned_audio_batch(batch)
+            batch = []
+    if batch:
+        deleted += await delete_orphaned_audio_batch(batch)
+    if deleted:
+        print(f"Deleted {deleted} orphaned audio files")
+
+async def audio_sweeper():
+    while True:
+        try:
+            if await is_scheduled_run_owner("audio_sweep", AUDIO_SWEEP_INTERVAL_SECONDS):
+                await sweep_orphaned_audio()
+        except Exception as e:
+            print(f"Error sweeping orphaned audio: {e}")
+        await asyncio.sleep(AUDIO_SWEEP_INTERVAL_SECONDS)
+
+# Walks a winning plan and lists its stages, e.g. "FETCH <- IXSCAN(username_1)"
+def describe_plan(plan: dict) -> str:
+    stages = []
+    while plan:
+        stage = plan.get("stage", "?")
+        if plan.get("indexName"):
+            stage += f"({plan['indexName']})"
+        stages.append(stage)
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return " <- ".join(stages)
+
+# Runs explain() on every hot-path query and reports which index (if any) it uses
+async def explain_hot_paths() -> List[dict]:
+    report = []
+    for name, collection_name, query, sort in HOT_PATH_QUERIES:
+        cursor = db[collection_name].find(query).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        try:
+            explanation = await cursor.explain()
+            plan = describe_plan(explanation.get("queryPlanner", {}).get("winningPlan", {}))
+        except Exception as e:
+            plan = f"explain failed: {e}"
+        report.append({"query": name, "collection": collection_name, "plan": plan, "collectionScan": "COLLSCAN" in plan})
+    return report
+
+# Identifies the current index plan, so a changed plan is applied again on the next deploy
+def index_plan_version() -> str:
+    plan = {collection_name: [model.document for model in models] for collection_name, models in INDEX_PLAN.items()}
+    return hashlib.sha256(json.dumps([plan, OBSOLETE_INDEXES], default=str).encode()).hexdigest()[:16]
+
+async def load_migration_record(version: str) -> Optional[dict]:
+    return await migrations_collection.find_one({"_id": version})
+
+async def apply_migrations(version: str) -> dict:
+    await run_migrations()
+    await apply_index_plan()
+    record = {"_id": version, "applied_at": datetime.now(timezone.utc), "worker": WORKER_ID}
+    await migrations_collection.replace_one({"_id": version}, record, upsert=True)
+    return record
+
+# With the mongo backend every worker warms up at the same time (and again whenever gunicorn recycles one),
+# so the migrations run under a lease: one worker applies them and records the plan version, and the others
+# wait for that record instead of repeating the deletes and index builds.
+async def migrate_database():
+    version = index_plan_version()
+    await run_exclusive(
+        "migrations",
+        lambda: apply_migrations(version),
+        lambda: load_migration_record(version)
+    )
+    if INDEX_REPORT_ON_STARTUP:
+        for entry in await explain_hot_paths():
+            print(f"[index report] {entry['collection']}: {entry['query']}: {entry['plan']}")
+
+# Endpoint to see which index each hot-path query uses
+@fast_app.get("/admin/index_report")
+async def get_index_report():
+    return {"queries": await explain_hot_paths()}
+
+# Password hashes are stored as scrypt$N$r$p$salt$hash (base64). Accounts created before scrypt still hold
+# an unsalted SHA-256 hex digest; those are verified as before and replaced on the next successful login.
+def scrypt_digest(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r * p + 2 ** 20, dklen=32)
+
+def hash_password_sync(password: str, n: int = PASSWORD_SCRYPT_N, r: int = PASSWORD_SCRYPT_R, p: int = PASSWORD_SCRYPT_P) -> str:
+    salt = secrets.token_bytes(16)
+    digest = scrypt_digest(password, salt, n, r, p)
+    return f"scrypt${n}${r}${p}${base64.b64encode(salt).decode()}${base64.b64encode(digest).decode()}"
+
+def verify_password_sync(stored_password: str, provided_password: str) -> bool:
+    if not stored_password:
+        return False
+    if stored_password.startswith("scrypt$"):
+        try:
+            _, n, r, p, salt, digest = stored_password.split("$")
+            expected = base64.b64decode(digest)
+            actual = scrypt_digest(provided_password, base64.b64decode(salt), int(n), int(r), int(p))
+        except ValueError:
+            return False
+        return hmac.compare_digest(expected, actual)
+    legacy = hashlib.sha256(provided_password.encode()).hexdigest()
+    return hmac.compare_digest(stored_password.encode(), legacy.encode())
+
+# True for legacy SHA-256 hashes and for scrypt hashes made with a different cost than the current one
+def password_needs_rehash(stored_password: str) -> bool:
+    return not stored_password.startswith(f"scrypt${PASSWORD_SCRYPT_N}${PASSWORD_SCRYPT_R}${PASSWORD_SCRYPT_P}$")
 
 # Password hashing function
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+async def hash_password(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(password_executor, hash_password_sync, password)
 
 # Helper function to check the password hash
-def verify_password(stored_password: str, provided_password: str) -> bool:
-    return stored_password == hash_password(provided_password)
+async def verify_password(stored_password: str, provided_password: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(
+        password_executor, verify_password_sync, stored_password, provided_password
+    )
 
-def fetch_news(preferences: UserPreferences) -> List[dict]:
+# Runs at most one copy of the coroutine built by factory per key; concurrent callers await the same result
+async def single_flight(key, factory):
+    task = inflight_tasks.get(key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        inflight_tasks[key] = task
+        task.add_done_callback(lambda _: inflight_tasks.pop(key, None))
+    return await asyncio.shield(task)
+
+# Takes the named lease unless another worker holds an unexpired one. Expiry times are UTC: the leases
+# TTL index reads them that way, and workers on hosts in different time zones must agree on them.
+async def acquire_lease(key: str, ttl_seconds: float = LEASE_TTL_SECONDS) -> bool:
+    now = datetime.now(timezone.utc)
+    try:
+        await leases_collection.update_one(
+            {"_id": key, "expires_at": {"$lt": now}},
+            {"$set": {"owner": WORKER_ID, "expires_at": now + timedelta(seconds=ttl_seconds)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+async def release_lease(key: str):
+    await leases_collection.delete_one({"_id": key, "owner": WORKER_ID})
+
+# Periodic jobs call this once per run. With the memory backend every process runs its own jobs; with the mongo
+# backend only the worker holding the job's lease does, and the lease is kept (not released) for one interval,
+# so the job runs about once per interval across the whole deployment.
+async def is_scheduled_run_owner(job: str, interval_seconds: float) -> bool:
+    if STATE_BACKEND != "mongo":
+        return True
+    return await acquire_lease(f"schedule:{job}", interval_seconds)
+
+# Runs build() while holding the lease for key. Workers that lose the race poll load_result() until the
+# winner's result is visible (or the lease expires) instead of repeating the work themselves.
+async def run_exclusive(key: str, build, load_result):
+    if not USE_MONGO_LEASES:
+        return await build()
+    while True:
+        if await acquire_lease(key):
+            try:
+                result = await load_result()
+                if result is not None:
+                    return result
+                return await build()
+            finally:
+                await release_lease(key)
+        await asyncio.sleep(LEASE_POLL_INTERVAL_SECONDS)
+        result = await load_result()
+        if result is not None:
+            return result
+
+# The same set of sources always maps to the same headline pool, whatever order the user picked them in
+def normalize_sources(sources: str) -> str:
+    return ",".join(sorted({source.strip() for source in sources.split(",") if source.strip()}))
+
+def is_complete_article(article: dict) -> bool:
+    return all(key in article and article[key] for key in ['title', 'description', 'urlToImage', 'content'])
+
+# Pages through top-headlines for one source set and keeps only articles that have complete data.
+# Pages are as large as NewsAPI allows, so one request usually fills the whole pool.
+async def fetch_headline_pool(sources_key: str) -> List[dict]:
     articles = []
-    page = 1  # Start fetching from the first page
-    while len(articles) < 10:  # Keep fetching until we have 10 articles
+    seen_urls = set()
+    for page in range(1, HEADLINE_MAX_PAGES + 1):
         params = {
             'apiKey': NEWS_API_KEY,
-            'sources': preferences.sources,  # Use the sources parameter
-            'pageSize': 10,  # Fetch 10 articles per request
-            'page': page  # Fetch the next page
+            'sources': sources_key,
+            'pageSize': HEADLINE_PAGE_SIZE,
+            'page': page
         }
-        response = requests.get(NEWS_API_URL, params=params)
-        
-        if response.status_code == 200:
-            new_articles = response.json().get('articles', [])
-            
-            # Filter articles to ensure they have complete data
-            for article in new_articles:
-                if all(key in article and article[key] for key in ['title', 'description', 'urlToImage', 'content']):
-                    articles.append(article)
-                
-                # Stop if we already have 10 complete articles
-                if len(articles) >= 10:
-                    break
-        page += 1  # Move to the next page
-        # If no new articles were fetched, break the loop to prevent an infinite loop
-        if not new_articles:
+        with track_upstream("newsapi", "top-headlines"):
+            response = await http_client.get(NEWS_API_URL, params=params)
+            response.raise_for_status()
+        new_articles = response.json().get('articles', [])
+        for article in new_articles:
+            if is_complete_article(article) and article['url'] not in seen_urls:
+                seen_urls.add(article['url'])
+                articles.append(article)
+        # Stop once the pool can fill a feed or NewsAPI has nothing more to give
+        if len(articles) >= HEADLINE_POOL_MIN_SIZE or len(new_articles) < HEADLINE_PAGE_SIZE:
             break
-    return articles[:10]
-
-def summarize_article(article: dict, summary_style: str) -> str:
-    content = article.get("content") or article.get("title") or "No content or title available."
-    if summary_style == "Brief":
-        prompt = f"Summarize this article briefly, keeping it insightful, yet concise. Please go straight into the summary, do not repeat the prompt in any way.: {content}"
-    elif summary_style == "Detailed":
-        prompt = f"Summarize this article in detail, but keep it interesting and thought-provoking. Please go straight into the summary, do not repeat the prompt in any way.: {content}"
-    elif summary_style == "ELI5":
-        prompt = f"Explain the key points of this article like I'm five years old, in a concise, yet interesting manner. Please go straight into the summary, do not repeat the prompt in any way.: {content}"
-    elif summary_style == "Humorous":
-        prompt = f"Summarize this article in a humorous way, to aid the user in understanding and taking away the most from the daily news through humor. Please go straight into the summary, do not repeat the prompt in any way.: {content}"
-    elif summary_style == "Storytelling":
-        prompt = f"Turn this article into a storytelling format, that keeps the user engrossed and helps them come away learning new things. Please go straight into the summary, do not repeat the prompt in any way.: {content}"
-    elif summary_style == "Poetic":
-        prompt = f"Turn this article into a poetic recitation, that is intriguing, yet informative: {content}"
+    return articles
+
+async def refresh_headline_pool(sources_key: str) -> List[dict]:
+    articles = await fetch_headline_pool(sources_key)
+    fetched_at = time.time()
+    remember_headline_pool(sources_key, articles, fetched_at)
+    if STATE_BACKEND == "mongo":
+        await headline_pools_collection.replace_one(
+            {"_id": sources_key},
+            {"articles": articles, "fetched_at": fetched_at},
+            upsert=True
+        )
+    return articles
+
+def remember_headline_pool(sources_key: str, articles: List[dict], fetched_at: float):
+    pool = headline_pools.setdefault(sources_key, {"last_requested": time.time()})
+    pool["articles"] = articles
+    pool["fetched_at"] = fetched_at
+
+# With the mongo backend, a pool another worker fetched recently is reused instead of calling NewsAPI again
+async def load_shared_headline_pool(sources_key: str) -> Optional[List[dict]]:
+    if STATE_BACKEND != "mongo":
+        return None
+    doc = await headline_pools_collection.find_one({"_id": sources_key})
+    if not doc or time.time() - doc["fetched_at"] >= HEADLINE_CACHE_TTL_SECONDS:
+        return None
+    remember_headline_pool(sources_key, doc["articles"], doc["fetched_at"])
+    return doc["articles"]
+
+# Shared headline cache: every user with the same source set reads from one pool, and concurrent
+# misses for the same set share one upstream fetch. A stale pool is served if NewsAPI fails; with no
+# pool at all the request fails with a 502, so an empty feed is never stored as if it were fresh.
+async def get_headline_pool(sources: str) -> List[dict]:
+    sources_key = normalize_sources(sources)
+    pool = headline_pools.get(sources_key)
+    if pool is not None:
+        pool["last_requested"] = time.time()
+        if "articles" in pool and time.time() - pool["fetched_at"] < HEADLINE_CACHE_TTL_SECONDS:
+            cache_requests_total.inc(cache="headlines", result="hit")
+            return pool["articles"]
+    cache_requests_total.inc(cache="headlines", result="miss")
+    try:
+        return await single_flight(
+            ("headlines", sources_key),
+            lambda: run_exclusive(
+                f"headlines:{sources_key}",
+                lambda: refresh_headline_pool(sources_key),
+                lambda: load_shared_headline_pool(sources_key)
+            )
+        )
+    except Exception as e:
+        print(f"Error refreshing headlines for {sources_key}: {e}")
+        if pool is not None and "articles" in pool:
+            return pool["articles"]
+        raise HTTPException(status_code=502, detail="Failed to fetch news from the news provider.")
+
+async def fetch_news(preferences: UserPreferences) -> List[dict]:
+    pool = await get_headline_pool(preferences.sources)
+    return pool[:10]
+
+# Keeps pools warm for source sets that were requested recently, and drops the ones nobody uses any more
+async def headline_refresher():
+    while True:
+        await asyncio.sleep(HEADLINE_REFRESH_INTERVAL_SECONDS)
+        now = time.time()
+        for sources_key, pool in list(headline_pools.items()):
+            if now - pool["last_requested"] > HEADLINE_ACTIVE_WINDOW_SECONDS:
+                headline_pools.pop(sources_key, None)
+                continue
+            try:
+                # With the mongo backend one worker refreshes each pool and the others pick up its copy
+                if await is_scheduled_run_owner(f"headlines:{sources_key}", HEADLINE_REFRESH_INTERVAL_SECONDS / 2):
+                    await single_flight(("headlines", sources_key), lambda: refresh_headline_pool(sources_key))
+                else:
+                    await load_shared_headline_pool(sources_key)
+            except Exception as e:
+                print(f"Error refreshing headlines for {sources_key}: {e}")
+
+# Instruction for each summary style; the article content follows it
+SUMMARY_STYLE_PROMPTS = {
+    "Brief": "Summarize this article briefly, keeping it insightful, yet concise. Please go straight into the summary, do not repeat the prompt in any way.",
+    "Detailed": "Summarize this article in detail, but keep it interesting and thought-provoking. Please go straight into the summary, do not repeat the prompt in any way.",
+    "ELI5": "Explain the key points of this article like I'm five years old, in a concise, yet interesting manner. Please go straight into the summary, do not repeat the prompt in any way.",
+    "Humorous": "Summarize this article in a humorous way, to aid the user in understanding and taking away the most from the daily news through humor. Please go straight into the summary, do not repeat the prompt in any way.",
+    "Storytelling": "Turn this article into a storytelling format, that keeps the user engrossed and helps them come away learning new things. Please go straight into the summary, do not repeat the prompt in any way.",
+    "Poetic": "Turn this article into a poetic recitation, that is intriguing, yet informative",
+}
+DEFAULT_SUMMARY_PROMPT = "Provide a generic summary of this article"
+SUMMARY_MODEL = "llama3-8b-8192"
+
+def article_content(article: dict) -> str:
+    return article.get("content") or article.get("title") or "No content or title available."
+
+def clean_summary(summary: str) -> str:
+    patterns = [
+        r"^Here(('|’)s| is) a summary of the article.*?:",
+        r"^Summarize(d|s|ing|ion).*?:",
+        r"^Explain(ed|ing|s).*?:",
+        r"^This article is about.*?:",
+        r"^Turn(ed|ing|s) into.*?:",
+    ]
+    combined_pattern = re.compile("|".join(patterns), re.IGNORECASE)
+    return re.sub(combined_pattern, "", summary).strip()
+
+async def summarize_article(article: dict, summary_style: str) -> str:
+    prompt = f"{SUMMARY_STYLE_PROMPTS.get(summary_style, DEFAULT_SUMMARY_PROMPT)}: {article_content(article)}"
+    with track_upstream("groq", "summary"):
+        chat_completion = await resources.groq_client.chat.completions.create(
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            model=SUMMARY_MODEL,
+        )
+    record_llm_usage(SUMMARY_MODEL, chat_completion.usage)
+    response = chat_completion.choices[0].message.content.strip()
+    return clean_summary(response)
+
+# Rough token count for sizing batches; llama3's tokenizer averages about 4 characters per token on English
+# news text, so 3 leaves some headroom.
+def estimate_tokens(text: str) -> int:
+    return len(text) // 3 + 1
+
+def summary_output_tokens(summary_style: str) -> int:
+    return SUMMARY_BATCH_OUTPUT_TOKENS_BY_STYLE.get(summary_style, SUMMARY_BATCH_OUTPUT_TOKENS_PER_ARTICLE)
+
+def batch_summary_prompt(summary_style: str) -> str:
+    instruction = SUMMARY_STYLE_PROMPTS.get(summary_style, DEFAULT_SUMMARY_PROMPT)
+    return (
+        "You will receive a JSON object with a list of news articles, each with an id, a title and its content. "
+        f"Write one summary per article, following this instruction for each of them: \"{instruction}\"\n"
+        'Reply with a JSON object only, of the form {"summaries": [{"id": "<article id>", "summary": "<summary>"}]}, '
+        "with exactly one entry for every article id."
+    )
+
+# Splits articles into batches whose prompt plus expected output fit in the model's context window,
+# and at most SUMMARY_BATCH_MAX_ARTICLES articles each. Yields lists of (index, article).
+def plan_summary_batches(articles: List[dict], summary_style: str):
+    budget = int(SUMMARY_MODEL_CONTEXT_TOKENS * 0.9) - estimate_tokens(batch_summary_prompt(summary_style))
+    batch = []
+    used = 0
+    for index, article in enumerate(articles):
+        cost = estimate_tokens(article.get("title") or "") + estimate_tokens(article_content(article)) + 20
+        cost += summary_output_tokens(summary_style)
+        if batch and (used + cost > budget or len(batch) >= SUMMARY_BATCH_MAX_ARTICLES):
+            yield batch
+            batch = []
+            used = 0
+        batch.append((index, article))
+        used += cost
+    if batch:
+        yield batch
+
+# Reads the summaries list from a batch reply. A reply cut off at max_tokens isn't valid JSON, so the entries
+# of the list are then decoded one at a time and every entry that was completed is kept.
+def parse_batch_entries(content: str) -> list:
+    try:
+        entries = json.loads(content)["summaries"]
+        return entries if isinstance(entries, list) else []
+    except (ValueError, KeyError, TypeError):
+        pass
+    decoder = json.JSONDecoder()
+    entries = []
+    position = content.find("[") + 1
+    if position == 0:
+        return entries
+    while True:
+        while position < len(content) and content[position] in " \t\r\n,":
+            position += 1
+        try:
+            entry, position = decoder.raw_decode(content, position)
+        except ValueError:
+            return entries
+        entries.append(entry)
+
+# Summarizes a batch of articles with one JSON-mode call. Returns {index: summary} for every article the
+# model answered properly; anything missing or malformed is left for the per-article fallback.
+async def summarize_batch(batch: List[tuple], summary_style: str) -> dict:
+    payload = {
+        "articles": [
+            {"id": str(index), "title": article.get("title") or "", "content": article_content(article)}
+            for index, article in batch
+        ]
+    }
+    with track_upstream("groq", "summary_batch"):
+        chat_completion = await resources.groq_client.chat.completions.create(
+            messages=[
+                {"role": "system", "content": batch_summary_prompt(summary_style)},
+                {"role": "user", "content": json.dumps(payload, ensure_ascii=False)}
+            ],
+            model=SUMMARY_MODEL,
+            response_format={"type": "json_object"},
+            max_tokens=summary_output_tokens(summary_style) * len(batch),
+        )
+    record_llm_usage(SUMMARY_MODEL, chat_completion.usage)
+    choice = chat_completion.choices[0]
+    entries = parse_batch_entries(choice.message.content or "")
+    if choice.finish_reason == "length":
+        print(f"Batch summary reply hit max_tokens, kept {len(entries)} of {len(batch)} summaries")
+    elif not entries:
+        print("Unparseable batch summary response, falling back to per-article calls")
+    expected = {str(index): index for index, _ in batch}
+    summaries = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        index = expected.get(str(entry.get("id")))
+        summary = entry.get("summary")
+        if index is not None and isinstance(summary, str) and summary.strip():
+            summaries[index] = clean_summary(summary.strip())
+    return summaries
+
+# Batched summarization: one call per batch instead of one per article. Articles a batch didn't return
+# (parse errors, missing ids, timeouts) are retried with the single-article prompt.
+async def summarize_articles_batched(articles: List[dict], summary_style: str, semaphore: asyncio.Semaphore) -> List[Optional[str]]:
+    async def run_batch(batch):
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(summarize_batch(batch, summary_style), timeout=SUMMARY_BATCH_TIMEOUT_SECONDS)
+            except Exception as e:
+                print(f"Batch summary of {len(batch)} articles failed, falling back to per-article calls: {e!r}")
+                return {}
+
+    results = [None] * len(articles)
+    for summaries in await asyncio.gather(*(run_batch(batch) for batch in plan_summary_batches(articles, summary_style))):
+        for index, summary in summaries.items():
+            results[index] = summary
+    missing = [index for index, summary in enumerate(results) if summary is None]
+    summary_batch_articles_total.inc(len(articles) - len(missing), outcome="batched")
+    summary_batch_articles_total.inc(len(missing), outcome="fallback")
+    fallbacks = await asyncio.gather(
+        *(summarize_article_bounded(articles[index], summary_style, semaphore) for index in missing)
+    )
+    for index, summary in zip(missing, fallbacks):
+        results[index] = summary
+    return results
+        
+# Key for the shared summary cache: the same article (by URL and content) in the same style
+# is summarized once and reused for every user that has it in their feed
+def summary_cache_key(article: dict, summary_style: str) -> str:
+    content = article.get("content") or article.get("title") or ""
+    content_hash = hashlib.sha256(content.encode()).hexdigest()
+    return hashlib.sha256(f"{article.get('url')}|{content_hash}|{summary_style}".encode()).hexdigest()
+
+# Looks up summaries in the in-process LRU first, then in MongoDB (one query for all the misses)
+async def get_cached_summaries(keys: List[str]) -> dict:
+    found = {}
+    now = time.time()
+    for key in keys:
+        entry = summary_cache.get(key)
+        if entry and now - entry[1] < SUMMARY_CACHE_TTL_SECONDS:
+            summary_cache.move_to_end(key)
+            found[key] = entry[0]
+    missing = [key for key in keys if key not in found]
+    cache_requests_total.inc(len(found), cache="summary_memory", result="hit")
+    if missing:
+        async for doc in summaries_collection.find({"_id": {"$in": missing}}, {"summary": 1, "created_at": 1}):
+            found[doc["_id"]] = doc["summary"]
+            # Mongo hands dates back as naive UTC
+            remember_summary(doc["_id"], doc["summary"], doc["created_at"].replace(tzinfo=timezone.utc).timestamp())
+        cache_requests_total.inc(len(found) - (len(keys) - len(missing)), cache="summary_mongo", result="hit")
+        cache_requests_total.inc(len(keys) - len(found), cache="summary_mongo", result="miss")
+    return found
+
+def remember_summary(key: str, summary: str, stored_at: float):
+    summary_cache[key] = (summary, stored_at)
+    summary_cache.move_to_end(key)
+    while len(summary_cache) > SUMMARY_CACHE_SIZE:
+        summary_cache.popitem(last=False)
+
+# Writes newly generated summaries to both cache layers; Mongo expires them through the TTL index on created_at,
+# which is written in UTC like every other TTL field
+async def store_summaries(new_summaries: dict, summary_style: str):
+    if not new_summaries:
+        return
+    now = datetime.now(timezone.utc)
+    for key, (url, summary) in new_summaries.items():
+        remember_summary(key, summary, now.timestamp())
+    try:
+        await summaries_collection.bulk_write([
+            UpdateOne(
+                {"_id": key},
+                {"$setOnInsert": {"url": url, "summaryStyle": summary_style, "summary": summary, "created_at": now}},
+                upsert=True
+            )
+            for key, (url, summary) in new_summaries.items()
+        ], ordered=False)
+    except Exception as e:
+        print(f"Error storing summaries: {e}")
+
+# Summarizes a single article, bounded by the shared semaphore and timeout.
+# Returns None if the LLM call fails or takes too long.
+async def summarize_article_bounded(article: dict, summary_style: str, semaphore: asyncio.Semaphore) -> Optional[str]:
+    async with semaphore:
+        try:
+            return await asyncio.wait_for(
+                summarize_article(article, summary_style),
+                timeout=SUMMARY_TIMEOUT_SECONDS
+            )
+        except Exception as e:
+            print(f"Summary failed for {article.get('url')}, falling back to description: {e!r}")
+            return None
+
+# Summarization stage for a freshly fetched feed. Cached summaries are reused, and the rest are requested
+# from the LLM up to SUMMARY_CONCURRENCY at once, so a cold feed costs roughly one round trip instead of
+# one per article. Failed summaries fall back to the article description and are not cached. Order is preserved.
+async def summarize_articles(articles: List[dict], summary_style: str) -> List[str]:
+    keys = [summary_cache_key(article, summary_style) for article in articles]
+    cached = await get_cached_summaries(keys)
+    semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+    pending = [(key, article) for key, article in zip(keys, articles) if key not in cached]
+    if SUMMARY_BATCH_MODE and len(pending) > 1:
+        results = await summarize_articles_batched([article for _, article in pending], summary_style, semaphore)
     else:
-        prompt = f"Provide a generic summary of this article: {content}"
-    chat_completion = grok_client.chat.completions.create(
-        messages=[
-            {"role": "user", "content": prompt}
+        results = await asyncio.gather(
+            *(summarize_article_bounded(article, summary_style, semaphore) for _, article in pending)
+        )
+    new_summaries = {}
+    for (key, article), summary in zip(pending, results):
+        if summary is not None:
+            new_summaries[key] = (article.get("url"), summary)
+    await store_summaries(new_summaries, summary_style)
+
+    summaries = []
+    for key, article in zip(keys, articles):
+        if key in cached:
+            summaries.append(cached[key])
+        elif key in new_summaries:
+            summaries.append(new_summaries[key][1])
+        else:
+            summaries.append(article.get("description") or article.get("title") or "No summary available")
+    return summaries
+
+# Fetches and summarizes new articles for the given preferences and stores them in the user's news document.
+# The podcast for the new articles is queued for background generation right away.
+async def refresh_user_news(username: str, preferences: dict, last_login: Optional[datetime] = None) -> List[dict]:
+    fetched_articles = await fetch_news(UserPreferences(**preferences))
+    summaries = await summarize_articles(fetched_articles, preferences['summaryStyle'])
+    articles = []
+    for article, summary in zip(fetched_articles, summaries):
+        articles.append({
+            "title": article['title'],
+            "source": article['source']['name'],
+            "description": article['description'],
+            "url": article['url'],
+            "published_at": article.get('publishedAt'),
+            "urlToImage": article.get('urlToImage'),
+            "summary": summary,
+            "isRead": False
+        })
+    # Update the user's document with the new articles and preferences
+    await news_articles_collection.update_one(
+        {"username": username},
+        {
+            "$set": {
+                "username": username,
+                "fetched_at": datetime.now(),
+                "preferences": preferences,
+                "articles": articles,
+                # Reading counters for the current feed, maintained by mark-as-read
+                "article_count": len(articles),
+                "read_count": 0,
+                "reading_time": 0
+            }
+        },
+        upsert=True
+    )
+    await enqueue_podcast_job(username, articles, preferences.get('summaryStyle', 'brief'), last_login)
+    return articles
+
+# Builds an outbox message. subject and html may contain SendGrid substitution tags (e.g. -username-), filled in
+# per recipient from substitutions, so messages that only differ in those tags are sent in the same request.
+# Outbox times are UTC, like lease times: workers in different time zones compare them and finished_at drives a TTL.
+def mail_message(kind: str, user_email: str, subject: str, html_content: str, substitutions: Optional[dict] = None) -> dict:
+    now = datetime.now(timezone.utc)
+    return {
+        "kind": kind,
+        "to": user_email,
+        "subject": subject,
+        "html": html_content,
+        "substitutions": substitutions or {},
+        "content_key": hashlib.sha256(f"{subject}\n{html_content}".encode()).hexdigest(),
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now
+    }
+
+# Adds messages to the outbox and wakes a mail worker
+async def enqueue_mail(messages: List[dict]):
+    if not messages:
+        return
+    await mail_outbox_collection.insert_many(messages, ordered=False)
+    if mail_wakeup:
+        mail_wakeup.set()
+
+def sendgrid_payload(batch: List[dict]) -> dict:
+    return {
+        "personalizations": [
+            {"to": [{"email": message["to"]}], "substitutions": message["substitutions"]}
+            for message in batch
         ],
-        model="llama3-8b-8192",
+        "from": {"email": SENDGRID_FROM_EMAIL},
+        "subject": batch[0]["subject"],
+        "content": [{"type": "text/html", "value": batch[0]["html"]}]
+    }
+
+# Seconds to wait before calling SendGrid again, from Retry-After or X-RateLimit-Reset (an epoch timestamp)
+def retry_after_seconds(headers) -> Optional[float]:
+    try:
+        if headers.get("Retry-After"):
+            return max(float(headers["Retry-After"]), 0)
+        if headers.get("X-RateLimit-Reset"):
+            return max(float(headers["X-RateLimit-Reset"]) - time.time(), 0)
+    except ValueError:
+        pass
+    return None
+
+# Sends one request through the configured transport. Returns the status code (None on a network error)
+# and how long to back off if SendGrid asked us to.
+async def deliver_mail(payload: dict) -> Tuple[Optional[int], Optional[float]]:
+    if MAIL_TRANSPORT == "local":
+        local_mailbox.append(payload)
+        mail_recipients_total.inc(len(payload["personalizations"]), outcome="local")
+        print(f"[local mail] {payload['subject']!r} to {len(payload['personalizations'])} recipients")
+        return 202, None
+    recipients = len(payload["personalizations"])
+    try:
+        with track_upstream("sendgrid", "mail_send"):
+            response = await http_client.post(
+                SENDGRID_API_URL,
+                json=payload,
+                headers={"Authorization": f"Bearer {SENDGRID_API_KEY}"}
+            )
+    except httpx.HTTPError as e:
+        print(f"Error sending email: {e}")
+        mail_recipients_total.inc(recipients, outcome="error")
+        return None, None
+    mail_recipients_total.inc(recipients, outcome=str(response.status_code))
+    if response.status_code >= 300:
+        print(f"SendGrid returned {response.status_code}: {response.text[:200]}")
+    return response.status_code, retry_after_seconds(response.headers)
+
+# Claims up to MAIL_BATCH_SIZE due messages sharing the oldest due message's content. The claim pushes
+# next_attempt_at forward, so messages held by a worker that died become due again after MAIL_CLAIM_TIMEOUT_SECONDS.
+async def claim_mail_batch() -> List[dict]:
+    now = datetime.now(timezone.utc)
+    due = {"status": "pending", "next_attempt_at": {"$lte": now}}
+    head = await mail_outbox_collection.find_one(due, {"content_key": 1}, sort=[("next_attempt_at", 1)])
+    if not head:
+        return []
+    cursor = mail_outbox_collection.find({**due, "content_key": head["content_key"]}, {"_id": 1}).limit(MAIL_BATCH_SIZE)
+    ids = [message["_id"] async for message in cursor]
+    claim = secrets.token_hex(8)
+    await mail_outbox_collection.update_many(
+        {**due, "_id": {"$in": ids}},
+        {"$set": {"claim": claim, "next_attempt_at": now + timedelta(seconds=MAIL_CLAIM_TIMEOUT_SECONDS)}}
     )
-    response = chat_completion.choices[0].message.content.strip()
-    def clean_summary(summary: str, style: str) -> str:
-        
-        patterns = [
-            r"^Here(('|’)s| is) a summary of the article.*?:",
-            r"^Summarize(d|s|ing|ion).*?:",
-            r"^Explain(ed|ing|s).*?:",
-            r"^This article is about.*?:",
-            r"^Turn(ed|ing|s) into.*?:",
+    return await mail_outbox_collection.find({"claim": claim}).to_list(None)
+
+# Sends a claimed batch and records the outcome. Returns how long the worker should pause (rate limiting).
+async def send_mail_batch(batch: List[dict]) -> float:
+    now = datetime.now(timezone.utc)
+    ids = [message["_id"] for message in batch]
+    status_code, retry_after = await deliver_mail(sendgrid_payload(batch))
+
+    if status_code and 200 <= status_code < 300:
+        await mail_outbox_collection.update_many(
+            {"_id": {"$in": ids}},
+            {"$set": {"status": "sent", "finished_at": now}, "$unset": {"claim": ""}}
+        )
+        return 0
+
+    if status_code == 429:
+        # Rate limited: not the messages' fault, so this doesn't count as an attempt
+        pause = retry_after if retry_after is not None else MAIL_RETRY_BASE_SECONDS
+        await mail_outbox_collection.update_many(
+            {"_id": {"$in": ids}},
+            {"$set": {"next_attempt_at": now + timedelta(seconds=pause)}, "$unset": {"claim": ""}}
+        )
+        return pause
+
+    # Network errors and 5xx are retried with exponential backoff; other 4xx responses won't succeed on retry
+    retryable = status_code is None or status_code >= 500
+    attempts = {"$add": ["$attempts", 1]}
+    await mail_outbox_collection.update_many(
+        {"_id": {"$in": ids}},
+        [
+            {"$set": {
+                "attempts": attempts,
+                "last_status": status_code,
+                "status": {"$cond": [{"$and": [retryable, {"$lt": [attempts, MAIL_MAX_ATTEMPTS]}]}, "pending", "failed"]},
+                "next_attempt_at": {"$add": [now, {"$multiply": [MAIL_RETRY_BASE_SECONDS * 1000, {"$pow": [2, "$attempts"]}]}]},
+                "finished_at": {"$cond": [{"$and": [retryable, {"$lt": [attempts, MAIL_MAX_ATTEMPTS]}]}, "$$REMOVE", now]}
+            }},
+            {"$unset": "claim"}
         ]
-        combined_pattern = re.compile("|".join(patterns), re.IGNORECASE)
-        return re.sub(combined_pattern, "", summary).strip()
-    cleaned_response = clean_summary(response, summary_style)
-    return cleaned_response
-        
-def send_news_summary_email(user_email: str, username: str, articles: List[dict], summary_style: str):
-    # Get SendGrid API Key from environment
-    sendgrid_api_key = os.getenv('SENDGRID_API_KEY')
-    sendgrid_email=os.getenv('SENDGRID_FROM_EMAIL')
-    
+    )
+    return 0
+
+async def mail_worker():
+    while True:
+        try:
+            batch = await claim_mail_batch()
+            if batch:
+                pause = await send_mail_batch(batch)
+                if pause:
+                    await asyncio.sleep(pause)
+                continue
+        except Exception as e:
+            print(f"Error in mail worker: {e}")
+        try:
+            await asyncio.wait_for(mail_wakeup.wait(), MAIL_POLL_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        mail_wakeup.clear()
+
+async def send_news_summary_email(user_email: str, username: str, articles: List[dict], summary_style: str):
     # Prepare email content
-    email_body = f"Hi {username},\n\nHere's your news summary:\n\n"
+    email_body = "Hi -username-,\n\nHere's your news summary:\n\n"
     
     for article in articles:
         email_body += f"Title: {article['title']}\n"
         email_body += f"Summary: {article.get('summary', 'No summary available')}\n\n"
     
     email_body += "Stay informed!\n"
-    # Create email message
-    message = Mail(
-        from_email=sendgrid_email,  # Must be a verified sender in SendGrid
-        to_emails=user_email,
-        subject=f'{username}, Your News Summary',
-        html_content=f'<pre>{email_body}</pre>'
-    )
-    try:
-        # Send email using SendGrid
-        sg = SendGridAPIClient(sendgrid_api_key)
-        response = sg.send(message)
-        print(f"Email sent to {user_email}. Status Code: {response.status_code}")
-        return True
-    except Exception as e:
-        print(f"Error sending email: {e}")
-        return False
+    await enqueue_mail([mail_message(
+        "news_summary",
+        user_email,
+        '-username-, Your News Summary',
+        f'<pre>{email_body}</pre>',
+        {"-username-": username}
+    )])
+    return True
     
 # All endpoints are added below
 @fast_app.get("/status")
@@ -209,39 +1357,58 @@ async def get_status(username: str = Cookie(None)):
     else:
         # If no cookie, the user is not logged in
         return {"isLoggedIn": False, "username": None}
-    
-def send_confirmation_email(user_email: str, confirmation_code: str):
-    # Get SendGrid API Key from environment
-    sendgrid_api_key = os.getenv('SENDGRID_API_KEY')
-    sendgrid_email = os.getenv('SENDGRID_FROM_EMAIL')
 
-    # Prepare email content
-    email_body = f"Hi,\n\nYour confirmation code is: {confirmation_code}\n\nPlease use this code to confirm your account.\n\nStay informed!"
-
-    # Create email message
-    message = Mail(
-        from_email=sendgrid_email,  # Must be a verified sender in SendGrid
-        to_emails=user_email,
-        subject='Confirm Your Account',
-        html_content=f'<pre>{email_body}</pre>'
-    )
+# Liveness: the process is up and serving requests
+@fast_app.get("/healthz")
+async def get_health():
+    return {"status": "ok"}
 
+# Readiness: warm-up has finished and Mongo answers a ping, so the worker can take traffic
+@fast_app.get("/readyz")
+async def get_readiness():
+    if not resources.ready:
+        return JSONResponse(status_code=503, content={"status": "warming up", "error": resources.warmup_error})
     try:
-        # Send email using SendGrid
-        sg = SendGridAPIClient(sendgrid_api_key)
-        response = sg.send(message)
-        print(f"Email sent to {user_email}. Status Code: {response.status_code}")
-        
-        # Updating the temporary user document with the new confirmation code, if multiple
-        temp_users_collection.update_one(
-            {"email": user_email},
-            {"$set": {"confirmation_code": confirmation_code}}
-        )
-
-        return True
+        await asyncio.wait_for(client.admin.command("ping"), READINESS_PING_TIMEOUT_SECONDS)
     except Exception as e:
-        print(f"Error sending email: {e}")
-        return False
+        return JSONResponse(status_code=503, content={"status": "mongo unavailable", "error": str(e)})
+    return {"status": "ready", "warmupSeconds": round(resources.warmup_seconds, 3)}
+
+# Endpoint for Prometheus to scrape; gauges are read from the in-process state at scrape time
+@fast_app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    gauges = {
+        "summary_cache_entries": len(summary_cache),
+        "headline_pools": len(headline_pools),
+        "podcast_queue_depth": podcast_queue.qsize() if podcast_queue else 0,
+        "inflight_builds": len(inflight_tasks),
+        "background_tasks": len(background_tasks),
+    }
+    lines = []
+    for metric in metrics_registry:
+        lines.extend(metric.render())
+    for name, value in gauges.items():
+        lines.extend([f"# TYPE {name} gauge", f"{name} {value}"])
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+    
+async def send_confirmation_email(user_email: str, confirmation_code: str):
+    # Prepare email content; the code is a substitution so every confirmation shares one SendGrid request
+    email_body = "Hi,\n\nYour confirmation code is: -code-\n\nPlease use this code to confirm your account.\n\nStay informed!"
+
+    await enqueue_mail([mail_message(
+        "confirmation",
+        user_email,
+        'Confirm Your Account',
+        f'<pre>{email_body}</pre>',
+        {"-code-": confirmation_code}
+    )])
+
+    # Updating the temporary user document with the new confirmation code, if multiple
+    await temp_users_collection.update_one(
+        {"email": user_email},
+        {"$set": {"confirmation_code": confirmation_code}}
+    )
+    return True
 
 def export_newsfeed_as_html(articles):
     html_content = f"""
@@ -276,41 +1443,32 @@ def export_newsfeed_as_html(articles):
 
 
 
-def send_newsfeed_html_email(user_email: str, username: str, html_content: str):
-    # Get SendGrid API Key from environment
-    sendgrid_api_key = os.getenv('SENDGRID_API_KEY')
-    sendgrid_email = os.getenv('SENDGRID_FROM_EMAIL')
-
-    # Create email with HTML content
-    message = Mail(
-        from_email=sendgrid_email,
-        to_emails=user_email,
-        subject=f'{username}, Your Personalized News Feed',
-        html_content=html_content
+# Users whose feeds are identical get the same html_content, so their digests go out in one request
+def newsfeed_html_message(user_email: str, username: str, html_content: str) -> dict:
+    return mail_message(
+        "digest",
+        user_email,
+        '-username-, Your Personalized News Feed',
+        html_content,
+        {"-username-": username}
     )
 
-    try:
-        # Send the email
-        sg = SendGridAPIClient(sendgrid_api_key)
-        response = sg.send(message)
-        print(f"Email sent to {user_email}. Status Code: {response.status_code}")
-        return True
-    except Exception as e:
-        print(f"Error sending email: {e}")
-        return False
+async def send_newsfeed_html_email(user_email: str, username: str, html_content: str):
+    await enqueue_mail([newsfeed_html_message(user_email, username, html_content)])
+    return True
 
 @fast_app.post("/signup")
 async def signup(user: UserCreate):
     # Hash the user's password for security
-    hashed_password = hash_password(user.password)
+    hashed_password = await hash_password(user.password)
 
     # Check if the email already exists in registered users
-    existing_user = users_collection.find_one({"email": user.email})
+    existing_user = await users_collection.find_one({"email": user.email})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered. Please log in, or sign up with a new Email")
 
     # Check if the username already exists
-    existing_user = users_collection.find_one({"username": user.username})
+    existing_user = await users_collection.find_one({"username": user.username})
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already exists")
 
@@ -327,7 +1485,7 @@ async def signup(user: UserCreate):
 
     # Try to insert the new user into the database
     try:
-        users_collection.insert_one(new_user)
+        await users_collection.insert_one(new_user)
         return {"message": "Signup successful!"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error during signup: {str(e)}")
@@ -359,7 +1517,7 @@ async def signup(user: UserCreate):
         "username": user.username,
         "email": user.email,
         "password": hashed_password,
-        "created_at": datetime.now(),
+        "created_at": datetime.now(timezone.utc),  # UTC for the temp_users TTL index
         "points": 0,
         "streak": 0,
         "last_login": None,
@@ -432,66 +1590,30 @@ async def verify_confirmation(request: VerifyConfirmationCodeRequest):
 #     raise HTTPException(status_code=401, detail="Invalid username or password")
 @fast_app.post("/login")
 async def login(user: UserLogin):
-    db_user = users_collection.find_one({"username": user.username})
-    if db_user and db_user["password"] == hash_password(user.password):
+    db_user = await users_collection.find_one(
+        {"username": user.username},
+        {"password": 1, "last_login": 1, "streak": 1}
+    )
+    if db_user and await verify_password(db_user["password"], user.password):
         print("Backend login successful for:", user.username)
         now = datetime.now()
+        update = {"last_login": now}
+        # Transparently move legacy SHA-256 (or outdated scrypt) hashes to the current scrypt cost
+        if password_needs_rehash(db_user["password"]):
+            update["password"] = await hash_password(user.password)
         last_login = db_user.get("last_login")
         streak = db_user.get("streak", 0)
-        # Check if preferences exist and frequency is set
-        if "preferences" in db_user and "frequency" in db_user["preferences"]:
-            # Check if it's time to send an email
-            last_email_sent = db_user.get("last_email_sent")
-            frequency_hours = db_user["preferences"]["frequency"]
-            # If no last email sent or time since last email exceeds frequency
-            if not last_email_sent or (now - last_email_sent).total_seconds() / 3600 >= frequency_hours:
-                # Fetch news articles
-                try:
-                    # Use the existing get_news function to fetch articles
-                    news_response = await get_news(user.username)
-                    articles = news_response.get("articles", [])
-                    # Send email if articles exist
-                    if articles:
-                        summarized_articles = []
-                        for article in articles:
-                            summary = article.get('summary', 'No summary available')
-                            source_name = article.get('source', 'Unknown Source')
-                            summarized_articles.append({
-                                "title": article['title'],
-                                "source": source_name,
-                                "description": article['description'],
-                                "url": article['url'],
-                                "published_at": article.get('publishedAt'),
-                                "urlToImage": article.get('urlToImage'),
-                                "summary": summary,
-                                "isRead": False
-                            })
-                         # Export news feed as HTML
-                        html_content = export_newsfeed_as_html(summarized_articles)
-                        # Send the HTML email
-                        email_sent = send_newsfeed_html_email(
-                            user_email=db_user["email"],
-                            username=user.username,
-                            html_content=html_content
-                        )
-                        # Update last email sent time if email was sent successfully
-                        if email_sent:
-                            users_collection.update_one(
-                                {"username": user.username},
-                                {"$set": {"last_email_sent": now}}
-                            )
-                except Exception as e:
-                    print(f"Error processing news for email: {e}")
         if last_login:
             last_login_date = last_login.date()
             if now.date() == last_login_date + timedelta(days=1):
                 streak += 1  
             elif now.date() > last_login_date + timedelta(days=1):
                 streak = 0 
+        update["streak"] = streak
         # Update last_login and streak
-        users_collection.update_one(
+        await users_collection.update_one(
             {"username": user.username},
-            {"$set": {"last_login": now, "streak": streak}}
+            {"$set": update}
         )
         return JSONResponse(content={"message": "Login successful", "username": user.username})
     
@@ -502,7 +1624,7 @@ async def login(user: UserLogin):
 async def update_preferences(username: str, preferences: UserPreferences):
     print(f"Attempting to update preferences for username: {username}")
   # Update the user's preferences in the database accordingly
-    result = users_collection.update_one(
+    result = await users_collection.update_one(
         {"username": username},
         {"$set": {"preferences": preferences.dict()}}
     )
@@ -510,148 +1632,223 @@ async def update_preferences(username: str, preferences: UserPreferences):
     # if error, user not found displayed
     print(f"Update result: {result.modified_count}")
     if result.modified_count:
-        # Construct the path to the audio file
-        audio_dir = os.path.join("src", "audio")
-        final_audio_file = os.path.join(audio_dir, f"{username}_final_podcast_audio.wav")
-        # Check if the audio file exists and delete it if it does
-        if os.path.exists(final_audio_file):
-            os.remove(final_audio_file)
-            print(f"Deleted existing audio file: {final_audio_file}")
+        # The stored podcast was made for the old preferences
+        await invalidate_podcasts(username)
         return {"message": "Preferences updated successfully"}
     raise HTTPException(status_code=404, detail="User not found")
     
 @fast_app.get("/news/{username}")
 async def get_news(username: str):
-    user = users_collection.find_one({"username": username})
+    user = await users_collection.find_one({"username": username})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    preferences = user.get("preferences")
-    if not preferences:
+    if not user.get("preferences"):
         raise HTTPException(status_code=400, detail="User preferences not set")
-    user_news_doc = news_articles_collection.find_one({"username": username})
+    return {"articles": await get_user_feed(user)}
+
+# Returns the user's stored articles, refreshing them if they are stale or the preferences changed
+# Simultaneous refreshes for the same user (e.g. the feed and podcast pages loading together) share one build.
+async def get_user_feed(user: dict) -> List[dict]:
+    username = user["username"]
+    preferences = user["preferences"]
+    articles = await load_fresh_feed(username, preferences)
+    if articles is not None:
+        return articles
+    return await single_flight(
+        ("news", username),
+        lambda: run_exclusive(
+            f"news:{username}",
+            lambda: refresh_user_news(username, preferences, user.get("last_login")),
+            lambda: load_fresh_feed(username, preferences)
+        )
+    )
+
+# Returns the stored articles if they were fetched with the current preferences and are recent enough, else None
+async def load_fresh_feed(username: str, preferences: dict) -> Optional[List[dict]]:
+    user_news_doc = await news_articles_collection.find_one({"username": username})
     # Check if the preferences have changed (e.g., compare the stored preferences with the current ones)
     if user_news_doc and user_news_doc['preferences'] == preferences:
         if datetime.now() - user_news_doc['fetched_at'] < timedelta(hours=preferences['frequency']):
-            # Return the stored articles if they are recent enough
-            articles = user_news_doc['articles']
-        else:
-            # Fetch new articles if the frequency has passed
-            fetched_articles = fetch_news(UserPreferences(**preferences))
-            articles = []
-            for article in fetched_articles:
-                summary = summarize_article(article, preferences['summaryStyle'])
-                articles.append({
-                    "title": article['title'],
-                    "source": article['source']['name'],
-                    "description": article['description'],
-                    "url": article['url'],
-                    "published_at": article.get('publishedAt'),
-                    "urlToImage": article.get('urlToImage'),
-                    "summary": summary,
-                    "isRead": False 
-                })
-            # Update the user's document with the new articles
-            news_articles_collection.update_one(
-                {"username": username},
-                {
-                    "$set": {
-                        "username": username,
-                        "fetched_at": datetime.now(),
-                        "preferences": preferences,
-                        "articles": articles
-                    }
-                },
-                upsert=True
-            )
+            cache_requests_total.inc(cache="news_feed", result="hit")
+            return user_news_doc['articles']
+        cache_requests_total.inc(cache="news_feed", result="stale")
     else:
-        # If preferences have changed, fetch new articles regardless of frequency
-        fetched_articles = fetch_news(UserPreferences(**preferences))
-        articles = []
-        for article in fetched_articles:
-            summary = summarize_article(article, preferences['summaryStyle'])
-            articles.append({
-                "title": article['title'],
-                "source": article['source']['name'],
-                "description": article['description'],
-                "url": article['url'],
-                "published_at": article.get('publishedAt'),
-                "urlToImage": article.get('urlToImage'),
-                "summary": summary,
-                "isRead": False
-            })
-        # Update the user's document with the new articles and preferences
-        news_articles_collection.update_one(
-            {"username": username},
-            {
-                "$set": {
-                    "username": username,
-                    "fetched_at": datetime.now(),
-                    "preferences": preferences,
-                    "articles": articles
-                }
-            },
-            upsert=True
-        )
-    return {"articles": articles}
+        cache_requests_total.inc(cache="news_feed", result="miss")
+    return None
+
+# Flags the given articles as read with a single in-place update of the matching array elements,
+# so concurrent feed refreshes and other reads are never overwritten by a stale copy of the array
+async def mark_articles_read(username: str, reading_times: dict):
+    updates = {}
+    array_filters = []
+    for index, (url, reading_time) in enumerate(reading_times.items()):
+        updates[f"articles.$[a{index}].isRead"] = True
+        updates[f"articles.$[a{index}].readingTime"] = reading_time
+        array_filters.append({f"a{index}.url": url, f"a{index}.isRead": {"$ne": True}})
+    # Articles that are already read are left alone, and the pre-image tells us exactly which ones flipped
+    before = await news_articles_collection.find_one_and_update(
+        {"username": username},
+        {"$set": updates},
+        array_filters=array_filters,
+        projection={"articles.url": 1, "articles.isRead": 1, "articles.source": 1, "preferences.category": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if before is None:
+        # Only on a miss do we work out which error to report
+        if not await users_collection.find_one({"username": username}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="User not found")
+        raise HTTPException(status_code=404, detail="No news data found for this user")
+    newly_read = [
+        article for article in before.get("articles", [])
+        if article.get("url") in reading_times and not article.get("isRead")
+    ]
+    if newly_read:
+        category = before.get("preferences", {}).get("category")
+        await record_reading(username, newly_read, reading_times, category)
+
+# Field names can't contain "." or start with "$", and source names sometimes do
+def stats_field(name: str) -> str:
+    return (name or "unknown").replace(".", "_").replace("$", "_")
+
+# Updates the current-feed counters and the per-day history with $inc, so statistics never need a rescan
+async def record_reading(username: str, newly_read: List[dict], reading_times: dict, category: Optional[str]):
+    reading_seconds = sum(reading_times[article["url"]] for article in newly_read)
+    await news_articles_collection.update_one(
+        {"username": username},
+        {"$inc": {"read_count": len(newly_read), "reading_time": reading_seconds}}
+    )
+    increments = {"articles_read": len(newly_read), "reading_seconds": reading_seconds}
+    for article in newly_read:
+        source_field = f"sources.{stats_field(article.get('source'))}"
+        increments[source_field] = increments.get(source_field, 0) + 1
+    if category:
+        increments[f"categories.{stats_field(category)}"] = len(newly_read)
+    day = datetime.now().strftime("%Y-%m-%d")
+    await reading_stats_collection.update_one(
+        {"_id": f"{username}:{day}"},
+        {"$inc": increments, "$setOnInsert": {"username": username, "day": day}},
+        upsert=True
+    )
 
 @fast_app.patch("/news/{username}/mark_as_read")
 async def mark_article_as_read(username: str, article_url: str, readingTime: int = 0):
-    # Find the user
-    user = users_collection.find_one({"username": username})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Find the user's news document
-    user_news_doc = news_articles_collection.find_one({"username": username})
-    if not user_news_doc:
-        raise HTTPException(status_code=404, detail="No news data found for this user")
-    # Update the "isRead" state for the specific article
-    updated_articles = []
-    for article in user_news_doc["articles"]:
-        if article["url"] == article_url:
-            article["isRead"] = True  # Mark as read
-            article["readingTime"] = readingTime
-        updated_articles.append(article)
-    
-    # Update the document with the new "isRead" state
-    news_articles_collection.update_one(
+    await mark_articles_read(username, {article_url: readingTime})
+    return {"message": "Article marked as read", "url": article_url}
+
+# Endpoint to mark many articles as read in one round trip
+@fast_app.patch("/news/{username}/mark_as_read/batch")
+async def mark_articles_as_read(username: str, request: MarkAsReadBatchRequest):
+    if not request.articles:
+        raise HTTPException(status_code=400, detail="No articles given")
+    if len(request.articles) > MARK_AS_READ_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {MARK_AS_READ_BATCH_LIMIT} articles can be marked at once")
+    reading_times = {article.url: article.readingTime for article in request.articles}
+    await mark_articles_read(username, reading_times)
+    return {"message": "Articles marked as read", "urls": list(reading_times)}
+
+# Sums the per-day reading history for the last `days` days (a range scan on the (username, day) index)
+async def get_reading_history(username: str, days: int) -> dict:
+    since = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    history = {"days": days, "articlesRead": 0, "readingTime": 0, "bySource": {}, "byCategory": {}, "daily": []}
+    async for day_doc in reading_stats_collection.find({"username": username, "day": {"$gte": since}}).sort("day", 1):
+        history["articlesRead"] += day_doc.get("articles_read", 0)
+        history["readingTime"] += day_doc.get("reading_seconds", 0)
+        for source, count in day_doc.get("sources", {}).items():
+            history["bySource"][source] = history["bySource"].get(source, 0) + count
+        for category, count in day_doc.get("categories", {}).items():
+            history["byCategory"][category] = history["byCategory"].get(category, 0) + count
+        history["daily"].append({
+            "day": day_doc["day"],
+            "articlesRead": day_doc.get("articles_read", 0),
+            "readingTime": day_doc.get("reading_seconds", 0)
+        })
+    return history
+
+# Reads the current-feed statistics from the counters on the news document, or None if there is no feed yet
+async def load_feed_statistics(username: str) -> Optional[dict]:
+    # Fetch only the counters of the user's news document, not the articles themselves
+    user_news_doc = await news_articles_collection.find_one(
         {"username": username},
-        {
-            "$set": {
-                "articles": updated_articles
-            }
-        }
+        {"article_count": 1, "read_count": 1, "reading_time": 1}
     )
-    return {"message": "Article marked as read", "url": article_url}
+    if not user_news_doc:
+        return None
+    if "article_count" not in user_news_doc:
+        user_news_doc = await backfill_feed_counters(username)
+    return {
+        "articlesRead": user_news_doc["read_count"],
+        "articlesLeft": user_news_doc["article_count"] - user_news_doc["read_count"],
+        "readingTime": user_news_doc["reading_time"],
+    }
 
 @fast_app.get("/news/{username}/statistics")
-async def get_news_statistics(username: str):
-    user = users_collection.find_one({"username": username})
+async def get_news_statistics(username: str, days: Optional[int] = None):
+    statistics = await load_feed_statistics(username)
+    if statistics is None:
+        if not await users_collection.find_one({"username": username}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="User not found")
+        raise HTTPException(status_code=404, detail="No news data found for this user")
+    if days is not None:
+        if not 1 <= days <= READING_HISTORY_MAX_DAYS:
+            raise HTTPException(status_code=400, detail=f"days must be between 1 and {READING_HISTORY_MAX_DAYS}")
+        statistics["history"] = await get_reading_history(username, days)
+    return statistics
+
+# News documents stored before the counters existed are counted once and then kept up to date incrementally
+async def backfill_feed_counters(username: str) -> dict:
+    user_news_doc = await news_articles_collection.find_one({"username": username}, {"articles": 1})
+    articles = user_news_doc.get("articles", [])
+    counters = {
+        "article_count": len(articles),
+        "read_count": sum(1 for article in articles if article.get("isRead")),
+        "reading_time": sum(article.get("readingTime", 0) for article in articles if article.get("isRead"))
+    }
+    await news_articles_collection.update_one({"username": username}, {"$set": counters})
+    return counters
+
+# Everything the logged-in views need in one round trip: one projected user read plus one counters read.
+# The body's hash is sent as an ETag, so unchanged dashboards are answered with 304 Not Modified.
+@fast_app.get("/dashboard/{username}")
+async def get_dashboard(username: str, request: Request):
+    user, statistics = await asyncio.gather(
+        users_collection.find_one(
+            {"username": username},
+            {"_id": 0, "username": 1, "points": 1, "streak": 1, "preferences": 1}
+        ),
+        load_feed_statistics(username)
+    )
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    # Fetch the user's news data
-    user_news_doc = news_articles_collection.find_one({"username": username})
-    if not user_news_doc:
-        raise HTTPException(status_code=404, detail="No news data found for this user")
-    
-    # Calculate statistics
-    total_articles = len(user_news_doc["articles"])
-    read_articles = sum(1 for article in user_news_doc["articles"] if article["isRead"])
-    unread_articles = total_articles - read_articles
-    
-    # Calculate total time spent (assuming each article has a 'timeSpent' field in seconds)
-    total_time_spent = sum(article.get("readingTime", 0) for article in user_news_doc["articles"])
-    return {
-        "articlesRead": read_articles,
-        "articlesLeft": unread_articles,
-        "readingTime": total_time_spent,
+    dashboard = {
+        "username": user["username"],
+        "points": user.get("points", 0),
+        "streak": user.get("streak", 0),
+        "preferences": user.get("preferences", {}),
+        "statistics": statistics
     }
+    content = json.dumps(dashboard, separators=(",", ":"), default=str).encode()
+    digest = hashlib.sha256(content).hexdigest()[:32]
+    # Each content-coding is its own representation and gets its own strong ETag
+    identity_etag, gzip_etag = f'"{digest}"', f'"{digest}-gzip"'
+    use_gzip = len(content) >= DASHBOARD_GZIP_MINIMUM_SIZE and "gzip" in request.headers.get("accept-encoding", "")
+    etag = gzip_etag if use_gzip else identity_etag
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+    # A client holding either encoding of unchanged data can keep it; the 304 names the copy it has
+    client_etags = {tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")}
+    for cached_etag in (etag, gzip_etag if etag == identity_etag else identity_etag):
+        if cached_etag in client_etags:
+            headers["ETag"] = cached_etag
+            return Response(status_code=304, headers=headers)
+    # Compressed here rather than with a global middleware, which would also try to gzip ranged audio responses
+    if use_gzip:
+        content = gzip.compress(content)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=content, media_type="application/json", headers=headers)
 
 # Endpoint to get preferences for the Profile Page display
 @fast_app.get("/user/{username}", response_model=UserPreferencesResponse)
 async def get_user_preferences(username: str):
-    user = users_collection.find_one({"username": username})
+    user = await users_collection.find_one({"username": username})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return {"username": user["username"], "preferences": user.get("preferences", {})}
@@ -660,17 +1857,17 @@ async def get_user_preferences(username: str):
 @fast_app.put("/user/{username}/password")
 async def update_user_password(username: str, request: UpdatePasswordRequest):
     # Fetch user from the database
-    user = users_collection.find_one({"username": username})
+    user = await users_collection.find_one({"username": username})
     
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     # Verify current password
-    if not verify_password(user['password'], request.current_password):
+    if not await verify_password(user['password'], request.current_password):
         raise HTTPException(status_code=400, detail="Current password is incorrect")
     # Hash new password
-    hashed_password = hash_password(request.new_password)
+    hashed_password = await hash_password(request.new_password)
     # Update the password in the database
-    result = users_collection.update_one(
+    result = await users_collection.update_one(
         {"username": username},
         {"$set": {"password": hashed_password}}
     )
@@ -680,33 +1877,80 @@ async def update_user_password(username: str, request: UpdatePasswordRequest):
     
     return {"message": "Password updated successfully"}
 
-# Endpoint to get all news articles stored in the database
+def export_json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+# Yields matching documents as NDJSON straight from the Mongo cursor, one batch at a time, so memory stays constant
+async def iter_ndjson_export(cursor):
+    async for document in cursor:
+        yield json.dumps(document, default=export_json_default) + "\n"
+
+# Endpoint to export the news documents stored in the database (admin use).
+# Pages are keyed on _id: pass the returned next_cursor as `after` to get the next page.
+# `fields` is a comma separated projection, e.g. fields=username,fetched_at. With format=ndjson every
+# matching document is streamed instead of a single page.
 @fast_app.get("/news_articles/")
-async def get_news_articles():
-    articles = list(news_articles_collection.find())
+async def get_news_articles(
+    limit: int = 50,
+    after: Optional[str] = None,
+    username: Optional[str] = None,
+    fetched_after: Optional[datetime] = None,
+    fetched_before: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    format: str = "json"
+):
+    query = {}
+    if username:
+        query["username"] = username
+    if fetched_after or fetched_before:
+        query["fetched_at"] = {}
+        if fetched_after:
+            query["fetched_at"]["$gte"] = fetched_after
+        if fetched_before:
+            query["fetched_at"]["$lt"] = fetched_before
+    if after:
+        try:
+            query["_id"] = {"$gt": ObjectId(after)}
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    projection = None
+    if fields:
+        projection = {field.strip(): 1 for field in fields.split(",") if field.strip()}
+
+    if format == "ndjson":
+        cursor = news_articles_collection.find(query, projection).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE)
+        return StreamingResponse(iter_ndjson_export(cursor), media_type="application/x-ndjson")
+    if format != "json":
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
+
+    limit = max(1, min(limit, EXPORT_MAX_PAGE_SIZE))
+    articles = await news_articles_collection.find(query, projection).sort("_id", 1).limit(limit).to_list(length=limit)
+    next_cursor = str(articles[-1]["_id"]) if len(articles) == limit else None
     # for mongoDB : Change the news ObjectIds to string same as endpoint 4
     for article in articles:
         article["_id"] = str(article["_id"])
-    return articles
+    return {"items": articles, "next_cursor": next_cursor}
 
 # Endpoint to delete a user from the database with their stored data
 @fast_app.delete("/user/{username}")
 async def delete_user(username: str):
     # if user is found in db, delete from the database
-    result = users_collection.delete_one({"username": username})
+    result = await users_collection.delete_one({"username": username})
     if result.deleted_count:
       # delete the news articles as well
-        news_articles_collection.delete_many({"username": username})
-        podcasts = db.podcasts.find({"username": username})
-        for podcast in podcasts:
+        await news_articles_collection.delete_many({"username": username})
+        await reading_stats_collection.delete_many({"username": username})
+        async for podcast in db.podcasts.find({"username": username}):
             file_id = podcast.get("audio_file_id")
             if file_id:
                 # Remove the associated audio file from GridFS
-                fs.delete(file_id)
+                await fs.delete(file_id)
                 print(f"Deleted audio file with file_id: {file_id}")
         
         # Delete the podcast records from the podcasts collection
-        db.podcasts.delete_many({"username": username})
+        await db.podcasts.delete_many({"username": username})
         
         return {"message": f"User {username} and articles associated with the account are deleted"}
     # error handling part when the user is not found
@@ -743,15 +1987,17 @@ async def generate_podcast_script(articles, summary_style, username):
             f"Ensure the podcast fits within 2 minutes (~300 words), sounds like it’s delivered by a charismatic and lively host."
         )
         # OpenAI API call using the updated syntax
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo", 
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant writing podcast scripts."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=500,
-            temperature=0.7
-        )
+        with track_upstream("openai", "podcast_script"):
+            response = await resources.openai_client.chat.completions.create(
+                model="gpt-3.5-turbo", 
+                messages=[
+                    {"role": "system", "content": "You are a helpful assistant writing podcast scripts."},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=500,
+                temperature=0.7
+            )
+        record_llm_usage("gpt-3.5-turbo", response.usage)
         podcast_text = response.choices[0].message.content.strip()
         #print("Generated Podcast Script:", podcast_text)
         return podcast_text
@@ -763,14 +2009,16 @@ async def generate_podcast_audio(script):
     try:
         
         # OpenAI API for text-to-speech (TTS)
-        response = openai.audio.speech.create(
-            model="tts-1",
-            voice="alloy", 
-            input=script
-        )
+        with track_upstream("openai", "tts"):
+            response = await resources.openai_client.audio.speech.create(
+                model="tts-1",
+                voice="alloy", 
+                input=script
+            )
         print("TTS Response:", response)
         
         audio_data = response.content
+        tts_bytes_total.inc(len(audio_data))
 
         return audio_data
     
@@ -784,7 +2032,9 @@ async def store_audio_to_gridfs(audio_data, username):
         print(f"Storing audio of size: {len(audio_data)} bytes")
         filename = f"{username}_podcast_audio.mp3"
 
-        file_id = fs.put(audio_data, filename=filename)
+        with track_upstream("gridfs", "upload"):
+            file_id = await fs.upload_from_stream(filename, audio_data)
+        gridfs_bytes_total.inc(len(audio_data), direction="write")
         print(f"Stored audio with file_id: {file_id}") 
 
         return file_id
@@ -793,62 +2043,253 @@ async def store_audio_to_gridfs(audio_data, username):
         raise HTTPException(status_code=500, detail="An error occurred while storing audio to GridFS.")
     
 
+# Stable fingerprint over only the fields that end up in the podcast (URL, title, summary and style).
+# Per-user state such as isRead and readingTime is left out, so reading articles never invalidates the audio.
+def podcast_fingerprint(articles: List[dict], summary_style: str) -> str:
+    relevant = [[article.get("url"), article.get("title"), article.get("summary")] for article in articles]
+    payload = json.dumps([summary_style, relevant], separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+# Queues podcast generation for a refreshed feed. Jobs for the same user and article set are only queued once.
+# With the mongo backend the queue is the podcast_jobs collection (one job per user, newest feed wins), so any
+# worker can pick the job up.
+async def enqueue_podcast_job(username: str, articles: List[dict], summary_style: str, last_login: Optional[datetime]):
+    global podcast_job_counter
+    if not PODCAST_PRECOMPUTE_ENABLED or not articles:
+        return
+    if not last_login or datetime.now() - last_login > timedelta(days=PODCAST_PRECOMPUTE_ACTIVE_DAYS):
+        return
+    job_key = (username, podcast_fingerprint(articles, summary_style))
+    if STATE_BACKEND == "mongo":
+        await podcast_jobs_collection.update_one(
+            {"_id": username},
+            {"$set": {
+                "fingerprint": job_key[1],
+                "summary_style": summary_style,
+                "priority": -last_login.timestamp(),
+                "status": "pending",
+                "available_at": datetime.now(timezone.utc)
+            }},
+            upsert=True
+        )
+        return
+    if podcast_queue is None:
+        return
+    if job_key in podcast_jobs:
+        return
+    # Most recent logins first; the counter keeps ordering stable between equal priorities
+    podcast_job_counter += 1
+    try:
+        podcast_queue.put_nowait((-last_login.timestamp(), podcast_job_counter, job_key, summary_style))
+        podcast_jobs.add(job_key)
+    except asyncio.QueueFull:
+        print(f"Podcast queue full, not precomputing podcast for {username}")
+
+async def run_podcast_job(job_key, summary_style: str):
+    username, fingerprint = job_key
+    user_news = await news_articles_collection.find_one({"username": username})
+    # Skip jobs whose feed has been replaced since they were queued
+    if not user_news or podcast_fingerprint(user_news.get("articles", []), summary_style) != fingerprint:
+        return
+    articles = user_news["articles"]
+    if await load_podcast_file_id(username, fingerprint):
+        return
+    await single_flight(
+        ("podcast", username),
+        lambda: run_exclusive(
+            f"podcast:{username}",
+            lambda: build_podcast(username, articles, summary_style, fingerprint),
+            lambda: load_podcast_file_id(username, fingerprint)
+        )
+    )
+    print(f"Precomputed podcast for {username}")
+
+async def podcast_worker():
+    while True:
+        _, _, job_key, summary_style = await podcast_queue.get()
+        try:
+            await run_podcast_job(job_key, summary_style)
+        except Exception as e:
+            print(f"Error precomputing podcast for {job_key[0]}: {e}")
+        finally:
+            podcast_jobs.discard(job_key)
+            podcast_queue.task_done()
+
+# Claims the highest-priority pending job. A job whose worker died becomes claimable again after LEASE_TTL_SECONDS.
+# Like leases, job times are UTC so that workers in different time zones agree on when a claim has expired.
+async def claim_podcast_job() -> Optional[dict]:
+    now = datetime.now(timezone.utc)
+    return await podcast_jobs_collection.find_one_and_update(
+        {"$or": [{"status": "pending"}, {"status": "running", "available_at": {"$lt": now}}]},
+        {"$set": {"status": "running", "owner": WORKER_ID, "available_at": now + timedelta(seconds=LEASE_TTL_SECONDS)}},
+        sort=[("priority", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+async def mongo_podcast_worker():
+    while True:
+        try:
+            job = await claim_podcast_job()
+        except Exception as e:
+            print(f"Error claiming podcast job: {e}")
+            job = None
+        if job is None:
+            await asyncio.sleep(PODCAST_JOB_POLL_SECONDS)
+            continue
+        try:
+            await run_podcast_job((job["_id"], job["fingerprint"]), job["summary_style"])
+        except Exception as e:
+            print(f"Error precomputing podcast for {job['_id']}: {e}")
+        finally:
+            # Left in place if the feed changed meanwhile: the upsert reset it to pending for the new fingerprint
+            await podcast_jobs_collection.delete_one({"_id": job["_id"], "fingerprint": job["fingerprint"], "status": "running"})
+
+# Removes the user's stored podcast and any queued precompute job, e.g. after a preferences change
+async def invalidate_podcasts(username: str):
+    async for podcast in db.podcasts.find({"username": username}, {"audio_file_id": 1}):
+        if podcast.get("audio_file_id"):
+            try:
+                await fs.delete(podcast["audio_file_id"])
+            except Exception as e:
+                print(f"Error deleting audio file {podcast['audio_file_id']}: {e}")
+    await db.podcasts.delete_many({"username": username})
+    if STATE_BACKEND == "mongo":
+        await podcast_jobs_collection.delete_one({"_id": username, "status": "pending"})
+
+# Returns the GridFS id of the user's podcast if it was generated for this fingerprint, else None.
+# This is a single query on the (username, fingerprint) index.
+async def load_podcast_file_id(username: str, fingerprint: str):
+    existing_podcast = await db.podcasts.find_one(
+        {"username": username, "fingerprint": fingerprint},
+        {"audio_file_id": 1}
+    )
+    if existing_podcast:
+        return existing_podcast["audio_file_id"]
+    return None
+
+# Replaces the user's stored podcast with the given audio and returns its GridFS id
+async def save_podcast(username: str, articles: List[dict], audio_data: bytes, fingerprint: str):
+    existing_podcast = await db.podcasts.find_one({"username": username})
+    if existing_podcast:
+        file_id = existing_podcast.get("audio_file_id")
+        if file_id:
+            print("The files were found.")
+            try:
+                await fs.delete(file_id)
+                print(f"Deleted audio file with file_id: {file_id}")
+            except NoFile:
+                # Already removed by another build or by the orphaned-audio sweep
+                print(f"Audio file with file_id {file_id} was already deleted")
+
+        await db.podcasts.delete_many({"username": username})
+        print(f"Deleted existing podcast record for username: {username}")
+
+    # Storing the podcast audio to GridFS
+    file_id = await store_audio_to_gridfs(audio_data, username)
+    print(f"Generated new file_id: {file_id}")
+
+    await db.podcasts.insert_one({
+        "username": username,
+        "articles": articles,
+        "fingerprint": fingerprint,
+        "audio_file_id": file_id,
+        "created_at": datetime.now(timezone.utc)
+    })
+    return file_id
+
+# Replaces the user's podcast with a newly generated one and returns its GridFS id
+async def build_podcast(username: str, articles: List[dict], summary_style: str, fingerprint: str):
+    podcast_script = await generate_podcast_script(articles, summary_style, username)
+    audio_data = await generate_podcast_audio(podcast_script)
+    return await save_podcast(username, articles, audio_data, fingerprint)
+
+# Splits a podcast script into TTS segments on paragraph and sentence boundaries.
+# The first segment is kept short so that the listener hears audio as early as possible.
+def split_podcast_script(script: str) -> List[str]:
+    pieces = []
+    for paragraph in script.splitlines():
+        paragraph = paragraph.strip()
+        if paragraph:
+            pieces.extend(sentence for sentence in re.split(r"(?<=[.!?])\s+", paragraph) if sentence)
+    segments = []
+    current = ""
+    for piece in pieces:
+        limit = PODCAST_FIRST_SEGMENT_CHARS if not segments else PODCAST_SEGMENT_CHARS
+        if current and len(current) + len(piece) + 1 > limit:
+            segments.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}".strip()
+    if current:
+        segments.append(current)
+    return segments
+
+async def synthesize_segment(segment: str, semaphore: asyncio.Semaphore) -> bytes:
+    async with semaphore:
+        return await generate_podcast_audio(segment)
+
+# Like build_podcast, but hands the segment tasks to segments_ready as soon as synthesis starts so the caller
+# can stream them. Waits for every segment, then stores the joined MP3 so later plays are a plain GridFS read.
+async def build_streamed_podcast(username: str, articles: List[dict], summary_style: str, fingerprint: str, segments_ready: asyncio.Future):
+    podcast_script = await generate_podcast_script(articles, summary_style, username)
+    segments = split_podcast_script(podcast_script)
+    if not segments:
+        raise HTTPException(status_code=500, detail="An error occurred while generating the podcast script.")
+
+    semaphore = asyncio.Semaphore(PODCAST_TTS_CONCURRENCY)
+    segment_tasks = [asyncio.create_task(synthesize_segment(segment, semaphore)) for segment in segments]
+    segments_ready.set_result(segment_tasks)
+    audio_segments = await asyncio.gather(*segment_tasks)
+    return await save_podcast(username, articles, b"".join(audio_segments), fingerprint)
+
+# Keeps a streamed build running after the response has been handed off, and logs it if storing fails
+async def finish_streamed_podcast(username: str, build: asyncio.Future):
+    try:
+        await build
+    except Exception as e:
+        print(f"Error storing streamed podcast for {username}: {e}")
+
+# Yields each segment's MP3 frames in script order as soon as that segment has been synthesized
+async def iter_podcast_segments(segment_tasks: List[asyncio.Task]):
+    for task in segment_tasks:
+        try:
+            yield await asyncio.shield(task)
+        except Exception as e:
+            print(f"Error streaming podcast segment: {e}")
+            return
+
 @fast_app.get("/podcast/{username}")
-async def create_podcast(username: str):
+async def create_podcast(username: str, request: Request):
     try:
         # Checking if the podcast exists by username and articles
-        user = users_collection.find_one({"username": username})
+        user = await users_collection.find_one({"username": username})
         if not user:
             raise HTTPException(status_code=404, detail="User not found.")
 
         # Checking for the user's existing podcast
-        user_news = news_articles_collection.find_one({"username": username})
+        user_news = await news_articles_collection.find_one({"username": username})
         if not user_news or not user_news.get("articles"):
             raise HTTPException(status_code=404, detail="No articles found for this user.")
         
-        # Checking if the podcast with the same articles exists
+        # Checking if the podcast for the same articles exists
         articles = user_news["articles"]
-        existing_podcast = db.podcasts.find_one({"username": username})
-
-        if existing_podcast:
-            existing_articles = existing_podcast.get("articles", [])
-
-            if articles != existing_articles:
-                print("Not the same articles.")
-
-                file_id = existing_podcast.get("audio_file_id")
-                if file_id:
-                    print("The files were found.")
-                    fs.delete(file_id)
-                    print(f"Deleted audio file with file_id: {file_id}")
-
-                db.podcasts.delete_many({"username": username})
-                print(f"Deleted existing podcast record for username: {username}")
-
-            else:
-                
-                file_id = existing_podcast["audio_file_id"]
-                print(f"Found existing podcast with file_id: {file_id}")
-                audio_file = fs.get(file_id)
-                return StreamingResponse(BytesIO(audio_file.read()), media_type="audio/mpeg")
-
-        # Generating a new podcast if no match is found
         preferences = user.get("preferences", {})
         summary_style = preferences.get("summaryStyle", "brief")
-        podcast_script = await generate_podcast_script(articles, summary_style, username)
-
-        audio_data = await generate_podcast_audio(podcast_script)
-
-        # Storing the podcast audio to GridFS
-        file_id = await store_audio_to_gridfs(audio_data, username)
-        print(f"Generated new file_id: {file_id}")  
-
-        db.podcasts.insert_one({
-            "username": username,
-            "articles": articles,
-            "audio_file_id": file_id,
-            "created_at": time.time()
-        })
+        fingerprint = podcast_fingerprint(articles, summary_style)
+        file_id = await load_podcast_file_id(username, fingerprint)
+        if file_id:
+            print(f"Found existing podcast with file_id: {file_id}")
+            return await stream_audio_response(request, file_id)
+
+        # Generating a new podcast if no match is found; concurrent requests for the same user share one generation
+        file_id = await single_flight(
+            ("podcast", username),
+            lambda: run_exclusive(
+                f"podcast:{username}",
+                lambda: build_podcast(username, articles, summary_style, fingerprint),
+                lambda: load_podcast_file_id(username, fingerprint)
+            )
+        )
 
         return JSONResponse(content={"audio_url": f"/audio/{str(file_id)}"})
     except HTTPException as e:
@@ -858,94 +2299,565 @@ async def create_podcast(username: str):
         print("Unexpected error in podcast endpoint:", e)
         return JSONResponse(content={"error": "An unexpected error occurred."}, status_code=500)
 
-@fast_app.get("/audio/{file_id}")
-async def get_audio(file_id: str):
+# Parses a single "bytes=start-end" / "bytes=start-" / "bytes=-suffix" range into inclusive (start, end).
+# Returns None if the range cannot be satisfied and raises ValueError for forms we don't handle (e.g. multiple ranges).
+def parse_range_header(range_header: str, length: int):
+    if not range_header.startswith("bytes=") or "," in range_header:
+        raise ValueError(f"Unsupported range: {range_header}")
+    start_text, _, end_text = range_header[len("bytes="):].strip().partition("-")
+    if not start_text:
+        suffix = int(end_text)
+        if suffix <= 0:
+            return None
+        return max(length - suffix, 0), length - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else length - 1
+    if start >= length or end < start:
+        return None
+    return start, min(end, length - 1)
+
+# Yields the requested byte range of a GridFS file one chunk at a time, so memory stays bounded per listener
+async def iter_gridfs_range(grid_out, start: int, end: int):
+    grid_out.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        with track_upstream("gridfs", "read_chunk"):
+            chunk = await grid_out.read(min(AUDIO_STREAM_CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        gridfs_bytes_total.inc(len(chunk), direction="read")
+        remaining -= len(chunk)
+        yield chunk
+
+# Streams a stored podcast with Range / 206 Partial Content support. GridFS files never change once written,
+# so the file id doubles as a strong ETag. URLs that always point at the same file can be cached as immutable;
+# URLs whose file can change (like /podcast/{username}) are revalidated against the ETag instead.
+async def stream_audio_response(request: Request, file_id, immutable: bool = False) -> Response:
+    with track_upstream("gridfs", "open"):
+        grid_out = await fs.open_download_stream(file_id)
+    length = grid_out.length
+    etag = f'"{file_id}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={AUDIO_CACHE_MAX_AGE_SECONDS}, immutable" if immutable else "private, no-cache"
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    start, end, status_code = 0, length - 1, 200
+    range_header = request.headers.get("range")
+    if range_header and length:
+        try:
+            byte_range = parse_range_header(range_header, length)
+            if byte_range is None:
+                headers["Content-Range"] = f"bytes */{length}"
+                return Response(status_code=416, headers=headers)
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+        except ValueError:
+            # Ranges we can't parse are ignored and the whole file is sent
+            pass
+    headers["Content-Length"] = str(max(end - start + 1, 0))
+    return StreamingResponse(
+        iter_gridfs_range(grid_out, start, end),
+        status_code=status_code,
+        media_type="audio/mpeg",
+        headers=headers
+    )
+
+# Streaming podcast mode: segments of the script are synthesized concurrently and sent to the client
+# as they become ready, instead of waiting for the whole file. The complete audio is written to GridFS
+# in the background (even if the listener disconnects), so replays use the regular cached path.
+# Generation shares the single-flight key and lease of /podcast/{username} and the precompute queue: if a
+# build is already running here or on another worker, the request waits for it and serves the stored file.
+@fast_app.get("/podcast/{username}/stream")
+async def stream_podcast(username: str, request: Request):
     try:
-        
-        object_id = ObjectId(file_id)  
-        print(f"Fetching audio with ObjectId: {object_id}") 
+        user = await users_collection.find_one({"username": username})
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found.")
 
-        file = fs.get(object_id)  
-        print(f"Found file in GridFS with ObjectId: {object_id}")  
+        user_news = await news_articles_collection.find_one({"username": username})
+        if not user_news or not user_news.get("articles"):
+            raise HTTPException(status_code=404, detail="No articles found for this user.")
 
-        audio_content = file.read() 
-        print(f"Audio file size: {len(audio_content)} bytes")  
+        articles = user_news["articles"]
+        preferences = user.get("preferences", {})
+        summary_style = preferences.get("summaryStyle", "brief")
+        fingerprint = podcast_fingerprint(articles, summary_style)
+        file_id = await load_podcast_file_id(username, fingerprint)
+        if file_id:
+            print(f"Found existing podcast with file_id: {file_id}")
+            return await stream_audio_response(request, file_id)
+
+        segments_ready = asyncio.get_running_loop().create_future()
+        build = asyncio.ensure_future(single_flight(
+            ("podcast", username),
+            lambda: run_exclusive(
+                f"podcast:{username}",
+                lambda: build_streamed_podcast(username, articles, summary_style, fingerprint, segments_ready),
+                lambda: load_podcast_file_id(username, fingerprint)
+            )
+        ))
+        await asyncio.wait([build, segments_ready], return_when=asyncio.FIRST_COMPLETED)
+        if not segments_ready.done():
+            # Another request or a precompute job did the work; the file is in GridFS now
+            return await stream_audio_response(request, build.result())
+
+        start_background_task(finish_streamed_podcast(username, build))
+        segment_tasks = segments_ready.result()
+        return StreamingResponse(
+            iter_podcast_segments(segment_tasks),
+            media_type="audio/mpeg",
+            headers={"Cache-Control": "no-store"}
+        )
+    except HTTPException as e:
+        print(f"Error in podcast stream endpoint: {e.detail}")
+        return JSONResponse(content={"error": e.detail}, status_code=e.status_code)
+    except Exception as e:
+        print("Unexpected error in podcast stream endpoint:", e)
+        return JSONResponse(content={"error": "An unexpected error occurred."}, status_code=500)
 
-        return StreamingResponse(BytesIO(audio_content), media_type="audio/mpeg")
+@fast_app.get("/audio/{file_id}")
+async def get_audio(file_id: str, request: Request):
+    try:
+        object_id = ObjectId(file_id)
+        print(f"Fetching audio with ObjectId: {object_id}")
+        return await stream_audio_response(request, object_id, immutable=True)
     except Exception as e:
         print("Error fetching audio from GridFS:", e)
         raise HTTPException(status_code=404, detail="Audio file not found.")
     
 # The points update endpoint
+def ledger_entry(username: str, points: int, reason: str, idempotency_key: Optional[str]) -> dict:
+    entry = {
+        "_id": ObjectId(),
+        "username": username,
+        "points": points,
+        "reason": reason,
+        "created_at": datetime.now()
+    }
+    if idempotency_key:
+        entry["idempotency_key"] = idempotency_key
+    return entry
+
+# Atomically adds points and returns (new total, whether this call awarded them).
+# The ledger entry is written first, so a retry with the same idempotency key finds it and awards nothing.
+# If the $inc fails the entry is removed again, so the ledger matches the totals and a retry can succeed.
+# Returns (None, False) if the user doesn't exist.
+async def award_points(username: str, points: int, reason: str, idempotency_key: Optional[str] = None):
+    entry = ledger_entry(username, points, reason, idempotency_key)
+    try:
+        await points_ledger_collection.insert_one(entry)
+    except DuplicateKeyError:
+        user = await users_collection.find_one({"username": username}, {"_id": 0, "points": 1})
+        return (user.get("points", 0) if user else None), False
+    try:
+        user = await users_collection.find_one_and_update(
+            {"username": username},
+            {"$inc": {"points": points}},
+            projection={"_id": 0, "points": 1},
+            return_document=ReturnDocument.AFTER
+        )
+    except Exception:
+        await points_ledger_collection.delete_one({"_id": entry["_id"]})
+        raise
+    if user is None:
+        await points_ledger_collection.delete_one({"_id": entry["_id"]})
+        return None, False
+    return user["points"], True
+
+# The points update endpoint. Clients may send an Idempotency-Key header (or idempotency_key parameter)
+# so that retrying the same award doesn't count it twice.
 @fast_app.post("/points/update")
-async def update_user_points(username: str, points: int):
-    user = users_collection.find_one({"username": username})
-    if not user:
+async def update_user_points(
+    username: str,
+    points: int,
+    reason: str = "reading",
+    idempotency_key: Optional[str] = None,
+    idempotency_key_header: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    new_points, awarded = await award_points(username, points, reason, idempotency_key or idempotency_key_header)
+    if new_points is None:
         raise HTTPException(status_code=404, detail="User not found.")
-    # Update user points in the database
-    new_points = user["points"] + points
-    users_collection.update_one(
-        {"username": username},
-        {"$set": {"points": new_points}}
-    )
-    return {"message": f"Points updated. New total: {new_points}"}
+    return {"message": f"Points updated. New total: {new_points}", "points": new_points, "awarded": awarded}
+
+# Endpoint for batch jobs to award points to many users in three round trips, however many awards there are:
+# one lookup of the users, one ledger insert and one bulk $inc
+@fast_app.post("/points/bulk")
+async def bulk_award_points(request: PointsBulkAwardRequest):
+    if len(request.awards) > POINTS_BULK_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {POINTS_BULK_LIMIT} awards can be made at once")
+    usernames = {award.username for award in request.awards}
+    existing_usernames = set(await users_collection.distinct("username", {"username": {"$in": list(usernames)}}))
+    entries = [
+        ledger_entry(award.username, award.points, request.reason, award.idempotency_key)
+        for award in request.awards if award.username in existing_usernames
+    ]
+    users_not_found = len(request.awards) - len(entries)
+    if not entries:
+        return {"awarded": 0, "duplicates": 0, "usersNotFound": users_not_found}
+    duplicate_indexes = set()
+    try:
+        await points_ledger_collection.insert_many(entries, ordered=False)
+    except BulkWriteError as e:
+        write_errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != 11000 for error in write_errors):
+            # Entries carry fresh _ids, so this only removes the ones this request inserted; nothing has been
+            # awarded yet, and a retry with the same idempotency keys starts from scratch
+            await points_ledger_collection.delete_many({"_id": {"$in": [entry["_id"] for entry in entries]}})
+            raise
+        duplicate_indexes = {error["index"] for error in write_errors}
+    new_entries = [entry for index, entry in enumerate(entries) if index not in duplicate_indexes]
+    if new_entries:
+        # Ledger entries whose $inc failed are removed again, as in award_points
+        try:
+            result = await users_collection.bulk_write([
+                UpdateOne({"username": entry["username"]}, {"$inc": {"points": entry["points"]}})
+                for entry in new_entries
+            ], ordered=False)
+        except BulkWriteError as e:
+            failed_ids = [new_entries[error["index"]]["_id"] for error in e.details.get("writeErrors", [])]
+            await points_ledger_collection.delete_many({"_id": {"$in": failed_ids}})
+            raise
+        except Exception:
+            await points_ledger_collection.delete_many({"_id": {"$in": [entry["_id"] for entry in new_entries]}})
+            raise
+        # Users deleted since the lookup above matched no update; their entries are rolled back too
+        if result.matched_count < len(new_entries):
+            still_existing = set(await users_collection.distinct(
+                "username", {"username": {"$in": list({entry["username"] for entry in new_entries})}}
+            ))
+            unmatched = [entry for entry in new_entries if entry["username"] not in still_existing]
+            if unmatched:
+                await points_ledger_collection.delete_many({"_id": {"$in": [entry["_id"] for entry in unmatched]}})
+                new_entries = [entry for entry in new_entries if entry["username"] in still_existing]
+                users_not_found += len(unmatched)
+    return {
+        "awarded": len(new_entries),
+        "duplicates": len(duplicate_indexes),
+        "usersNotFound": users_not_found
+    }
+
+def check_leaderboard_field(by: str):
+    if by not in LEADERBOARD_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Leaderboard must be one of: {', '.join(LEADERBOARD_FIELDS)}")
+
+# Walks the index in rank order once and keeps the ordering in memory:
+# "ordered" is [(username, score)] best first, "positions" maps username to its index in it,
+# and "ascending_scores" lets a rank be computed with a binary search.
+async def build_rank_snapshot(field: str) -> dict:
+    ordered = []
+    cursor = users_collection.find({}, {"_id": 0, "username": 1, field: 1}).sort([(field, -1), ("username", 1)])
+    async for user in cursor:
+        ordered.append((user["username"], user.get(field) or 0))
+    snapshot = {
+        "ordered": ordered,
+        "positions": {username: position for position, (username, _) in enumerate(ordered)},
+        "ascending_scores": sorted(score for _, score in ordered),
+        "built_at": time.time()
+    }
+    rank_snapshots[field] = snapshot
+    return snapshot
+
+async def get_rank_snapshot(field: str) -> dict:
+    snapshot = rank_snapshots.get(field)
+    if snapshot is None:
+        snapshot = await single_flight(("rank_snapshot", field), lambda: build_rank_snapshot(field))
+    return snapshot
+
+async def leaderboard_refresher():
+    while True:
+        for field in LEADERBOARD_FIELDS:
+            try:
+                await single_flight(("rank_snapshot", field), lambda: build_rank_snapshot(field))
+            except Exception as e:
+                print(f"Error refreshing {field} leaderboard: {e}")
+        await asyncio.sleep(LEADERBOARD_REFRESH_SECONDS)
+
+# Endpoint to get the top users by points or streak
+@fast_app.get("/leaderboard")
+async def get_leaderboard(by: str = "points", limit: int = 10):
+    check_leaderboard_field(by)
+    limit = max(1, min(limit, LEADERBOARD_MAX_LIMIT))
+    cursor = users_collection.find({}, {"_id": 0, "username": 1, by: 1}).sort([(by, -1), ("username", 1)]).limit(limit)
+    leaders = []
+    async for user in cursor:
+        leaders.append({"rank": len(leaders) + 1, "username": user["username"], by: user.get(by) or 0})
+    return {"by": by, "leaders": leaders}
+
+# Endpoint to get a user's rank and the users ranked just above and below them.
+# The user's own score is read live; the rank is a binary search over the snapshot's scores.
+@fast_app.get("/leaderboard/{username}")
+async def get_user_rank(username: str, by: str = "points", neighbours: int = 2):
+    check_leaderboard_field(by)
+    neighbours = max(0, min(neighbours, LEADERBOARD_MAX_LIMIT))
+    user = await users_collection.find_one({"username": username}, {"_id": 0, by: 1})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    score = user.get(by) or 0
+    snapshot = await get_rank_snapshot(by)
+    scores = snapshot["ascending_scores"]
+    rank = len(scores) - bisect.bisect_right(scores, score) + 1
+
+    ordered = snapshot["ordered"]
+    position = snapshot["positions"].get(username, rank - 1)
+    start = max(0, position - neighbours)
+    # Tied scores share a rank, the same way the user's own rank is computed
+    nearby = [
+        {"rank": len(scores) - bisect.bisect_right(scores, value) + 1, "username": name, by: value}
+        for name, value in ordered[start:position + neighbours + 1]
+    ]
+    return {
+        "by": by,
+        "username": username,
+        by: score,
+        "rank": rank,
+        "totalUsers": len(ordered),
+        "neighbours": nearby,
+        "snapshotAge": round(time.time() - snapshot["built_at"], 1)
+    }
 
 # New endpoint to fetch current points
 @fast_app.get("/points/{username}")
 async def get_user_points(username: str):
-    user = users_collection.find_one({"username": username}, {"_id": 0, "points": 1})
+    user = await users_collection.find_one({"username": username}, {"_id": 0, "points": 1})
     if not user:
         raise HTTPException(status_code=404, detail="User not found.")
     return {"username": username, "points": user["points"]}
 
 
-@fast_app.get("/news_sources")
-async def fetch_news_sources():
-    """
-    Fetch and process news sources grouped by country and category.
-    """
+# Builds the catalogue and its lookups from the raw NewsAPI source list: country -> category -> sources,
+# category -> country -> sources, and source id -> source
+def build_source_catalogue(sources_data: List[dict], fetched_at: float) -> dict:
+    sources = []
+    by_country = {}
+    by_category = {}
+    by_id = {}
+    for source in sources_data:
+        country = source.get("country")
+        category = source.get("category")
+        source_id = source.get("id")
+        source_name = source.get("name")
+
+        if not country or not category or not source_id or not source_name:
+            continue
+
+        entry = {"id": source_id, "name": source_name}
+        sources.append({"id": source_id, "name": source_name, "country": country, "category": category})
+        by_country.setdefault(country, {}).setdefault(category, []).append(entry)
+        by_category.setdefault(category, {}).setdefault(country, []).append(entry)
+        by_id[source_id] = {"country": country, "category": category, "source": entry}
+    return {
+        "sources": sources,
+        "by_country": by_country,
+        "by_category": by_category,
+        "by_id": by_id,
+        "fetched_at": fetched_at
+    }
+
+# Fetches the catalogue from NewsAPI and keeps a copy in Mongo so a cold start can serve it without the network
+async def refresh_source_catalogue() -> dict:
+    global source_catalogue
     if not NEWS_API_KEY:
         raise HTTPException(status_code=500, detail="API key is not configured.")
-
-    try:
-        response = requests.get(
-            f"https://newsapi.org/v2/top-headlines/sources?apiKey={NEWS_API_KEY}"
+    with track_upstream("newsapi", "sources"):
+        response = await http_client.get(
+            f"{NEWS_API_URL}/sources", params={"apiKey": NEWS_API_KEY}
         )
         response.raise_for_status()  # Raise HTTPError for bad responses (4xx and 5xx)
-        sources_data = response.json().get("sources", [])
-
-        # Process data into a nested structure: country -> category -> sources
-        country_data = {}
-        for source in sources_data:
-            country = source.get("country")
-            category = source.get("category")
-            source_id = source.get("id")
-            source_name = source.get("name")
+    catalogue = build_source_catalogue(response.json().get("sources", []), time.time())
+    source_catalogue = catalogue
+    try:
+        await news_sources_collection.replace_one(
+            {"_id": "catalogue"},
+            {"sources": catalogue["sources"], "fetched_at": datetime.fromtimestamp(catalogue["fetched_at"])},
+            upsert=True
+        )
+    except Exception as e:
+        print(f"Error persisting news source catalogue: {e}")
+    return catalogue
 
-            if not country or not category or not source_id or not source_name:
-                continue
+# Returns None when there is no copy or Mongo can't be reached, so callers fall back to NewsAPI
+async def load_persisted_source_catalogue() -> Optional[dict]:
+    try:
+        doc = await news_sources_collection.find_one({"_id": "catalogue"})
+        if not doc:
+            return None
+        return build_source_catalogue(doc["sources"], doc["fetched_at"].timestamp())
+    except Exception as e:
+        print(f"Error loading persisted news source catalogue: {e}")
+        return None
 
-            if country not in country_data:
-                country_data[country] = {}
-            if category not in country_data[country]:
-                country_data[country][category] = []
+def revalidate_source_catalogue():
+    async def revalidate():
+        try:
+            await single_flight("source_catalogue", refresh_source_catalogue)
+        except Exception as e:
+            print(f"Error refreshing news source catalogue: {e}")
+    start_background_task(revalidate())
+
+# Stale-while-revalidate: a stale catalogue is still served while a background refresh runs (a failed refresh,
+# including a malformed NewsAPI body, only logs). On a cold start the copy in Mongo is used, and NewsAPI is only
+# waited on when there is no copy at all; that is the only case in which a failed fetch reaches the caller.
+async def get_source_catalogue() -> dict:
+    global source_catalogue
+    if source_catalogue is None:
+        source_catalogue = await load_persisted_source_catalogue()
+    if source_catalogue is None:
+        return await single_flight("source_catalogue", refresh_source_catalogue)
+    if time.time() - source_catalogue["fetched_at"] > SOURCE_CATALOGUE_TTL_SECONDS:
+        revalidate_source_catalogue()
+    return source_catalogue
+
+async def source_catalogue_refresher():
+    global source_catalogue
+    while True:
+        try:
+            catalogue = await get_source_catalogue()
+            if time.time() - catalogue["fetched_at"] > SOURCE_CATALOGUE_TTL_SECONDS:
+                if await is_scheduled_run_owner("source_catalogue", SOURCE_CATALOGUE_REFRESH_SECONDS):
+                    await single_flight("source_catalogue", refresh_source_catalogue)
+                else:
+                    source_catalogue = await load_persisted_source_catalogue() or source_catalogue
+        except Exception as e:
+            print(f"Error refreshing news source catalogue: {e}")
+        await asyncio.sleep(SOURCE_CATALOGUE_REFRESH_SECONDS)
 
-            country_data[country][category].append({"id": source_id, "name": source_name})
+@fast_app.get("/news_sources")
+async def fetch_news_sources(country: Optional[str] = None, category: Optional[str] = None, source: Optional[str] = None):
+    """
+    Fetch and process news sources grouped by country and category.
+    Optional country, category and source (id) filters return only that slice of the catalogue.
+    """
+    try:
+        catalogue = await get_source_catalogue()
+    except (httpx.HTTPError, ValueError, KeyError, TypeError, AttributeError) as e:
+        # Network errors, and NewsAPI bodies that aren't the expected JSON
+        raise HTTPException(status_code=500, detail=f"Failed to fetch data: {str(e)}")
 
-        return {
-            "countries": list(country_data.keys()),
-            "data": country_data,
+    if source:
+        match = catalogue["by_id"].get(source)
+        matches_filters = match and country in (None, match["country"]) and category in (None, match["category"])
+        country_data = {match["country"]: {match["category"]: [match["source"]]}} if matches_filters else {}
+    elif country and category:
+        sources = catalogue["by_country"].get(country, {}).get(category)
+        country_data = {country: {category: sources}} if sources else {}
+    elif country:
+        country_data = {country: catalogue["by_country"][country]} if country in catalogue["by_country"] else {}
+    elif category:
+        country_data = {
+            country_code: {category: sources}
+            for country_code, sources in catalogue["by_category"].get(category, {}).items()
         }
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch data: {str(e)}")
+    else:
+        country_data = catalogue["by_country"]
+
+    return {
+        "countries": list(country_data.keys()),
+        "data": country_data,
+    }
 
 @fast_app.get("/streak/{username}")
 async def get_streak(username: str):
-    user = users_collection.find_one({"username": username})
+    user = await users_collection.find_one({"username": username})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return {"streak": user.get("streak", 0)}
 
+# Builds one user's digest for the outbox, or None if there is nothing to send
+async def build_digest(user: dict) -> Optional[dict]:
+    username = user["username"]
+    try:
+        articles = await get_user_feed(user)
+    except Exception as e:
+        print(f"Error building digest feed for {username}: {e}")
+        return None
+    if not articles:
+        return None
+    return newsfeed_html_message(user["email"], username, export_newsfeed_as_html(articles))
+
+# Builds and enqueues digests for a batch of users, marking them as sent; the outbox takes care of delivery and retries
+async def enqueue_digests(users: List[dict], now: datetime) -> int:
+    digests = await asyncio.gather(*(build_digest(user) for user in users))
+    messages = [digest for digest in digests if digest]
+    if not messages:
+        return 0
+    await enqueue_mail(messages)
+    usernames = [user["username"] for user, digest in zip(users, digests) if digest]
+    await users_collection.update_many(
+        {"username": {"$in": usernames}},
+        {"$set": {"last_email_sent": now}}
+    )
+    return len(messages)
+
+# Finds every user whose preferences.frequency window has elapsed since last_email_sent and enqueues their digests
+# in batches of DIGEST_BATCH_SIZE. Each distinct frequency is one range scan on the (frequency, last_email_sent) index.
+async def run_digest_cycle() -> int:
+    now = datetime.now()
+    sent = 0
+    frequencies = await users_collection.distinct("preferences.frequency")
+    for frequency in frequencies:
+        if not isinstance(frequency, (int, float)):
+            continue
+        cursor = users_collection.find(
+            {
+                "preferences.frequency": frequency,
+                "$or": [
+                    {"last_email_sent": None},
+                    {"last_email_sent": {"$lte": now - timedelta(hours=frequency)}}
+                ]
+            },
+            {"username": 1, "email": 1, "preferences": 1, "last_login": 1}
+        )
+        batch = []
+        async for user in cursor:
+            batch.append(user)
+            if len(batch) >= DIGEST_BATCH_SIZE:
+                sent += await enqueue_digests(batch, now)
+                batch = []
+        if batch:
+            sent += await enqueue_digests(batch, now)
+    return sent
+
+async def digest_scheduler():
+    while True:
+        try:
+            sent = 0
+            if await is_scheduled_run_owner("digest", DIGEST_SCHEDULER_INTERVAL_SECONDS):
+                sent = await run_digest_cycle()
+            if sent:
+                print(f"Digest cycle queued {sent} e-mails")
+        except Exception as e:
+            print(f"Error in digest scheduler: {e}")
+        await asyncio.sleep(DIGEST_SCHEDULER_INTERVAL_SECONDS)
+
+def start_background_task(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+def start_background_jobs():
+    global podcast_queue, mail_wakeup
+    mail_wakeup = asyncio.Event()
+    for _ in range(MAIL_WORKERS):
+        start_background_task(mail_worker())
+    start_background_task(headline_refresher())
+    start_background_task(leaderboard_refresher())
+    start_background_task(source_catalogue_refresher())
+    start_background_task(audio_sweeper())
+    if PODCAST_PRECOMPUTE_ENABLED and STATE_BACKEND == "mongo":
+        for _ in range(PODCAST_PRECOMPUTE_WORKERS):
+            start_background_task(mongo_podcast_worker())
+    elif PODCAST_PRECOMPUTE_ENABLED:
+        podcast_queue = asyncio.PriorityQueue(maxsize=PODCAST_QUEUE_MAX_SIZE)
+        for _ in range(PODCAST_PRECOMPUTE_WORKERS):
+            start_background_task(podcast_worker())
+    if DIGEST_SCHEDULER_ENABLED:
+        start_background_task(digest_scheduler())
+
 REACT_APP_FRONTEND_URL = os.getenv("REACT_APP_FRONTEND_URL", "http://localhost:3000")  # default to localhost if not set
 PORT = int(os.getenv("PORT", 8000))
 fast_app.add_middleware(
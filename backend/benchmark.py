@@ -0,0 +1,302 @@
+# End-to-end benchmark for the backend. Starts fake_upstreams.py and the API against a local MongoDB,
+# runs scripted user journeys (signup -> login -> preferences -> feed -> mark read -> podcast -> dashboard)
+# for N concurrent users and reports p50/p95/p99 latency and requests per second for each endpoint.
+#
+# Results are written as JSON so runs can be compared between releases:
+#   python benchmark.py --users 50 --output results.json
+#   python benchmark.py --users 50 --baseline results.json   # exits 1 if any endpoint's p95 regressed
+#
+# Needs a local mongod (e.g. `docker run -p 27017:27017 mongo`). Pass --base-url to benchmark an API
+# that is already running instead; it must then be configured to use the fake upstreams itself.
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import secrets
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_SETS = ["bbc-news,cnn", "techcrunch,the-verge", "espn", "bbc-news,le-monde"]
+SUMMARY_STYLES = ["Brief", "Detailed", "Humorous"]
+
+
+# Nearest-rank percentile over an already sorted list
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    # Sends one request and records its latency under the endpoint's route template
+    async def request(self, http_client, name, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await http_client.request(method, url, **kwargs)
+            await response.aread()
+        except httpx.HTTPError as e:
+            self.errors[name] += 1
+            print(f"{name}: {e!r}")
+            return None
+        self.latencies[name].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[name] += 1
+            print(f"{name} -> {response.status_code}: {response.text[:200]}")
+        return response
+
+    def summary(self, wall_seconds):
+        endpoints = {}
+        for name in sorted(set(self.latencies) | set(self.errors)):
+            values = sorted(self.latencies[name])
+            endpoints[name] = {
+                "requests": len(values),
+                "errors": self.errors[name],
+                "rps": round(len(values) / wall_seconds, 2) if wall_seconds else None,
+                "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else None,
+                "p50_ms": round(percentile(values, 0.50) * 1000, 2) if values else None,
+                "p95_ms": round(percentile(values, 0.95) * 1000, 2) if values else None,
+                "p99_ms": round(percentile(values, 0.99) * 1000, 2) if values else None,
+                "max_ms": round(values[-1] * 1000, 2) if values else None,
+            }
+        return endpoints
+
+
+async def user_journey(http_client, recorder, number, run_id, feed_reads):
+    username = f"bench_{run_id}_{number}"
+    password = secrets.token_hex(8)
+    await recorder.request(http_client, "POST /signup", "POST", "/signup", json={
+        "username": username, "email": f"{username}@example.com", "password": password
+    })
+    await recorder.request(http_client, "POST /login", "POST", "/login", json={
+        "username": username, "password": password
+    })
+    await recorder.request(http_client, "GET /news_sources", "GET", "/news_sources")
+    await recorder.request(http_client, "PUT /preferences/{username}", "PUT", f"/preferences/{username}", json={
+        "country": "us",
+        "category": "general",
+        "sources": SOURCE_SETS[number % len(SOURCE_SETS)],
+        "summaryStyle": SUMMARY_STYLES[number % len(SUMMARY_STYLES)],
+        "frequency": 24,
+    })
+
+    articles = []
+    for _ in range(feed_reads):
+        response = await recorder.request(http_client, "GET /news/{username}", "GET", f"/news/{username}")
+        if response is not None and response.status_code == 200:
+            articles = response.json().get("articles", [])
+
+    if articles:
+        await recorder.request(
+            http_client, "PATCH /news/{username}/mark_as_read/batch", "PATCH", f"/news/{username}/mark_as_read/batch",
+            json={"articles": [{"url": article["url"], "readingTime": 30} for article in articles[:3]]}
+        )
+        await recorder.request(http_client, "GET /podcast/{username}", "GET", f"/podcast/{username}")
+
+    await recorder.request(http_client, "GET /dashboard/{username}", "GET", f"/dashboard/{username}")
+    await recorder.request(http_client, "GET /leaderboard", "GET", "/leaderboard")
+
+
+async def wait_until_up(url, process=None, timeout=60):
+    deadline = time.time() + timeout
+    async with httpx.AsyncClient() as http_client:
+        while time.time() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"{url} exited with code {process.returncode}")
+            try:
+                if (await http_client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def start_upstreams(args):
+    upstream_url = f"http://127.0.0.1:{args.upstream_port}"
+    upstreams = subprocess.Popen(
+        [
+            sys.executable, "fake_upstreams.py", "--port", str(args.upstream_port),
+            "--news-latency-ms", str(args.news_latency_ms),
+            "--llm-latency-ms", str(args.llm_latency_ms),
+            "--tts-latency-ms", str(args.tts_latency_ms),
+            "--mail-latency-ms", str(args.mail_latency_ms),
+        ],
+        cwd=BACKEND_DIR,
+    )
+    return upstream_url, upstreams
+
+
+# Environment that points the API at the fake upstreams and a throwaway database
+def backend_env(args, upstream_url, db_name, workers=1):
+    return {
+        **os.environ,
+        "MONGO_URI": args.mongo_uri,
+        "MONGO_DB_NAME": db_name,
+        "MONGO_TLS": "false",
+        "STATE_BACKEND": "mongo" if workers > 1 else "memory",
+        "NEWS_API_KEY": "benchmark",
+        "NEWS_API_BASE_URL": f"{upstream_url}/newsapi/v2",
+        "GROQ_API_KEY": "benchmark",
+        "GROQ_BASE_URL": f"{upstream_url}/groq",
+        "openai.api_key": "benchmark",
+        "OPENAI_BASE_URL": f"{upstream_url}/openai/v1",
+        "SENDGRID_API_KEY": "benchmark",
+        "SENDGRID_FROM_EMAIL": "benchmark@example.com",
+        "SENDGRID_API_URL": f"{upstream_url}/sendgrid/v3/mail/send",
+        "DIGEST_SCHEDULER_ENABLED": "false",
+    }
+
+
+def start_servers(args, db_name):
+    upstream_url, upstreams = start_upstreams(args)
+    api = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "api:fast_app",
+            "--port", str(args.api_port), "--workers", str(args.api_workers), "--log-level", "warning",
+        ],
+        cwd=BACKEND_DIR,
+        env=backend_env(args, upstream_url, db_name, args.api_workers),
+    )
+    return upstream_url, [api, upstreams]
+
+
+def stop_processes(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Prints p95 changes against an earlier result file; returns False if any endpoint got slower than allowed
+def compare(results, baseline, max_regression):
+    ok = True
+    for name, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous or not previous.get("p95_ms") or current.get("p95_ms") is None:
+            continue
+        change = current["p95_ms"] / previous["p95_ms"] - 1
+        flag = ""
+        if change > max_regression:
+            flag = "  REGRESSION"
+            ok = False
+        print(f"{name:45s} p95 {previous['p95_ms']:9.1f} -> {current['p95_ms']:9.1f} ms ({change:+.0%}){flag}")
+    return ok
+
+
+async def run(args):
+    run_id = datetime.now().strftime("%Y%m%d%H%M%S")
+    db_name = f"news_app_benchmark_{run_id}"
+    processes = []
+    upstream_url = args.upstream_url
+    base_url = args.base_url
+    try:
+        if not base_url:
+            upstream_url, processes = start_servers(args, db_name)
+            base_url = f"http://127.0.0.1:{args.api_port}"
+            await wait_until_up(f"{upstream_url}/stats", processes[1])
+            await wait_until_up(f"{base_url}/readyz", processes[0])
+
+        recorder = Recorder()
+        limits = httpx.Limits(max_connections=args.users)
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as http_client:
+            if upstream_url:
+                await http_client.post(f"{upstream_url}/stats/reset")
+            start = time.perf_counter()
+            await asyncio.gather(*(
+                user_journey(http_client, recorder, number, run_id, args.feed_reads) for number in range(args.users)
+            ))
+            wall = time.perf_counter() - start
+            upstream_calls = (await http_client.get(f"{upstream_url}/stats")).json() if upstream_url else None
+
+        results = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "config": {
+                "users": args.users,
+                "feed_reads": args.feed_reads,
+                "api_workers": args.api_workers,
+                "latency_ms": {
+                    "news": args.news_latency_ms,
+                    "llm": args.llm_latency_ms,
+                    "tts": args.tts_latency_ms,
+                    "mail": args.mail_latency_ms,
+                },
+            },
+            "wall_seconds": round(wall, 3),
+            "total_requests": sum(len(values) for values in recorder.latencies.values()),
+            "endpoints": recorder.summary(wall),
+            "upstream_calls": upstream_calls,
+        }
+    finally:
+        stop_processes(processes)
+        if processes and not args.keep_data:
+            from pymongo import MongoClient
+            MongoClient(args.mongo_uri).drop_database(db_name)
+    return results
+
+
+def print_table(results):
+    print(f"\n{results['total_requests']} requests in {results['wall_seconds']}s")
+    print(f"{'endpoint':45s} {'n':>6s} {'err':>4s} {'rps':>8s} {'p50':>9s} {'p95':>9s} {'p99':>9s}")
+    for name, stats in results["endpoints"].items():
+        cells = [stats[key] if stats[key] is not None else float("nan") for key in ("rps", "p50_ms", "p95_ms", "p99_ms")]
+        print(f"{name:45s} {stats['requests']:6d} {stats['errors']:4d} {cells[0]:8.1f} {cells[1]:9.1f} {cells[2]:9.1f} {cells[3]:9.1f}")
+    if results["upstream_calls"] is not None:
+        print(f"upstream calls: {results['upstream_calls']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the backend with scripted user journeys")
+    parser.add_argument("--users", type=int, default=20, help="concurrent users, each running one journey")
+    parser.add_argument("--feed-reads", type=int, default=3, help="GET /news requests per user (first is cold)")
+    parser.add_argument("--mongo-uri", default="mongodb://127.0.0.1:27017")
+    parser.add_argument("--api-port", type=int, default=8100)
+    parser.add_argument("--api-workers", type=int, default=1)
+    parser.add_argument("--upstream-port", type=int, default=9100)
+    parser.add_argument("--news-latency-ms", type=float, default=150)
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--tts-latency-ms", type=float, default=1500)
+    parser.add_argument("--mail-latency-ms", type=float, default=100)
+    parser.add_argument("--base-url", help="benchmark an API that is already running instead of starting one")
+    parser.add_argument("--upstream-url", help="fake upstreams used by --base-url, for upstream call counts")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--keep-data", action="store_true", help="don't drop the benchmark database afterwards")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare p95 latencies against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p95 slowdown, as a fraction")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_table(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.max_regression):
+            sys.exit(1)
@@ -0,0 +1,175 @@
+# Local stand-ins for NewsAPI, Groq, OpenAI and SendGrid, used by benchmark.py so the backend can be
+# load tested without API keys or network access. Every route sleeps for a configurable latency so the
+# numbers reflect how the backend copes with slow upstreams rather than how fast a mock is.
+#
+# Point the backend at it with:
+#   NEWS_API_BASE_URL=http://localhost:9000/newsapi/v2
+#   GROQ_BASE_URL=http://localhost:9000/groq
+#   OPENAI_BASE_URL=http://localhost:9000/openai/v1
+#   SENDGRID_API_URL=http://localhost:9000/sendgrid/v3/mail/send
+#
+# Usage: python fake_upstreams.py --port 9000 --news-latency-ms 150 --llm-latency-ms 800
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+
+from fastapi import FastAPI, Request, Response
+
+# Latencies in milliseconds, overridable through the environment when started with uvicorn directly
+LATENCY_MS = {
+    "news": float(os.getenv("FAKE_NEWS_LATENCY_MS", 150)),
+    "llm": float(os.getenv("FAKE_LLM_LATENCY_MS", 800)),
+    "tts": float(os.getenv("FAKE_TTS_LATENCY_MS", 1500)),
+    "mail": float(os.getenv("FAKE_MAIL_LATENCY_MS", 100)),
+}
+ARTICLES_PER_SOURCE = int(os.getenv("FAKE_ARTICLES_PER_SOURCE", 20))
+TTS_BYTES_PER_CHAR = int(os.getenv("FAKE_TTS_BYTES_PER_CHAR", 60))  # ~128 kbps speech
+
+SOURCES = [
+    {"id": "bbc-news", "name": "BBC News", "category": "general", "country": "gb"},
+    {"id": "cnn", "name": "CNN", "category": "general", "country": "us"},
+    {"id": "techcrunch", "name": "TechCrunch", "category": "technology", "country": "us"},
+    {"id": "the-verge", "name": "The Verge", "category": "technology", "country": "us"},
+    {"id": "espn", "name": "ESPN", "category": "sports", "country": "us"},
+    {"id": "le-monde", "name": "Le Monde", "category": "general", "country": "fr"},
+]
+
+app = FastAPI()
+calls = Counter()
+
+
+async def upstream_delay(kind: str):
+    calls[kind] += 1
+    await asyncio.sleep(LATENCY_MS[kind] / 1000)
+
+
+def fake_article(source_id: str, number: int) -> dict:
+    return {
+        "source": {"id": source_id, "name": source_id.replace("-", " ").title()},
+        "author": "Benchmark",
+        "title": f"{source_id} headline {number}",
+        "description": f"Description of {source_id} story {number}.",
+        "url": f"https://example.com/{source_id}/{number}",
+        "urlToImage": f"https://example.com/{source_id}/{number}.jpg",
+        "publishedAt": "2024-01-01T00:00:00Z",
+        "content": f"Body of {source_id} story {number}. " * 40,
+    }
+
+
+@app.get("/newsapi/v2/top-headlines")
+async def top_headlines(sources: str = "", pageSize: int = 20, page: int = 1):
+    await upstream_delay("news")
+    articles = [
+        fake_article(source_id, number)
+        for source_id in sources.split(",") if source_id
+        for number in range(ARTICLES_PER_SOURCE)
+    ]
+    start = (page - 1) * pageSize
+    return {"status": "ok", "totalResults": len(articles), "articles": articles[start:start + pageSize]}
+
+
+@app.get("/newsapi/v2/top-headlines/sources")
+async def top_headline_sources():
+    await upstream_delay("news")
+    return {
+        "status": "ok",
+        "sources": [
+            {**source, "description": source["name"], "url": f"https://example.com/{source['id']}", "language": "en"}
+            for source in SOURCES
+        ],
+    }
+
+
+def chat_completion(model: str, content: str, prompt_chars: int) -> dict:
+    return {
+        "id": f"chatcmpl-{hashlib.md5(content.encode()).hexdigest()[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+        ],
+        "usage": {
+            "prompt_tokens": prompt_chars // 4,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": (prompt_chars + len(content)) // 4,
+        },
+    }
+
+
+def fake_summary(text: str) -> str:
+    digest = hashlib.md5(text.encode()).hexdigest()[:8]
+    return (f"Summary {digest}: a short, made-up summary of the story for benchmarking. " * 3).strip()
+
+
+async def fake_chat(request: Request) -> dict:
+    await upstream_delay("llm")
+    body = await request.json()
+    messages = body.get("messages", [])
+    prompt = "\n".join(message.get("content", "") for message in messages)
+    if body.get("response_format", {}).get("type") == "json_object":
+        # Batched summaries: the last message carries {"articles": [{"id", "title", "content"}]}
+        calls["llm_batch"] += 1
+        articles = json.loads(messages[-1]["content"]).get("articles", [])
+        content = json.dumps({
+            "summaries": [{"id": article["id"], "summary": fake_summary(article["content"])} for article in articles]
+        })
+    else:
+        content = fake_summary(prompt)
+    return chat_completion(body.get("model", "fake"), content, len(prompt))
+
+
+@app.post("/groq/openai/v1/chat/completions")
+async def groq_chat(request: Request):
+    return await fake_chat(request)
+
+
+@app.post("/openai/v1/chat/completions")
+async def openai_chat(request: Request):
+    return await fake_chat(request)
+
+
+@app.post("/openai/v1/audio/speech")
+async def openai_speech(request: Request):
+    await upstream_delay("tts")
+    body = await request.json()
+    size = max(len(body.get("input", "")), 1) * TTS_BYTES_PER_CHAR
+    return Response(content=b"\xff\xfb\x90\x00" + bytes(size), media_type="audio/mpeg")
+
+
+@app.post("/sendgrid/v3/mail/send")
+async def sendgrid_send(request: Request):
+    await upstream_delay("mail")
+    body = await request.json()
+    calls["mail_recipients"] += len(body.get("personalizations", []))
+    return Response(status_code=202)
+
+
+# Upstream call counts, so a benchmark can tell how many requests the backend's caches saved
+@app.get("/stats")
+async def stats():
+    return dict(calls)
+
+
+@app.post("/stats/reset")
+async def reset_stats():
+    calls.clear()
+    return {}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run fake NewsAPI/Groq/OpenAI/SendGrid upstreams")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    for kind in LATENCY_MS:
+        parser.add_argument(f"--{kind}-latency-ms", type=float, default=LATENCY_MS[kind])
+    args = parser.parse_args()
+    for kind in LATENCY_MS:
+        LATENCY_MS[kind] = getattr(args, f"{kind}_latency_ms")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
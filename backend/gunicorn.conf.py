@@ -0,0 +1,31 @@
+# Multi-worker deployment: gunicorn manages several uvicorn workers that share state through MongoDB.
+#
+# Usage (from backend/): gunicorn -c gunicorn.conf.py api:fast_app
+#
+# WEB_CONCURRENCY sets the number of workers (default: one per CPU). Several nodes can run this against the
+# same MongoDB; nothing is kept on the local filesystem.
+import multiprocessing
+import os
+
+# Shared locks, headline pools, podcast jobs and scheduler leadership have to live in Mongo once there is
+# more than one process. Set here, before the workers start, so every worker inherits it.
+os.environ.setdefault("STATE_BACKEND", "mongo")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# The app is not preloaded: each worker creates its own Mongo and HTTP clients after the fork, and
+# /readyz reports per worker when its warm-up is done.
+preload_app = False
+
+# Podcast generation can hold a request for a while; anything beyond this is a stuck worker
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 180))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+
+# Recycle workers now and then so slow leaks can't build up; jitter keeps them from restarting together
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 1000))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG")  # e.g. "-" for stdout; off by default
@@ -0,0 +1,52 @@
+# Small load test for the backend: fires concurrent requests at one endpoint and reports latencies.
+# If handlers block the event loop, total wall time grows with the number of requests instead of
+# staying close to the slowest single request.
+#
+# Usage: python loadtest.py --base-url http://localhost:8000 --path /news/alice --concurrency 20
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def timed_request(http_client: httpx.AsyncClient, method: str, url: str) -> float:
+    start = time.perf_counter()
+    response = await http_client.request(method, url)
+    elapsed = time.perf_counter() - start
+    if response.status_code >= 400:
+        print(f"{method} {url} -> {response.status_code}")
+    return elapsed
+
+
+async def run(base_url: str, path: str, method: str, concurrency: int, rounds: int):
+    url = base_url.rstrip("/") + path
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=None, limits=limits) as http_client:
+        for round_number in range(1, rounds + 1):
+            start = time.perf_counter()
+            latencies = await asyncio.gather(
+                *(timed_request(http_client, method, url) for _ in range(concurrency))
+            )
+            wall = time.perf_counter() - start
+            latencies.sort()
+            print(
+                f"round {round_number}: {concurrency} x {method} {path} "
+                f"wall={wall:.3f}s "
+                f"p50={statistics.median(latencies):.3f}s "
+                f"max={latencies[-1]:.3f}s "
+                f"sum={sum(latencies):.3f}s "
+                f"concurrency_achieved={sum(latencies) / wall:.1f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fire concurrent requests at one backend endpoint")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--path", required=True)
+    parser.add_argument("--method", default="GET")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.base_url, args.path, args.method.upper(), args.concurrency, args.rounds))
@@ -0,0 +1,109 @@
+# Sizes the password hashing pool. For each pool size it runs a burst of scrypt verifications through a
+# thread pool from an asyncio loop (the same way /login does) and reports throughput, p50/p95/p99 latency
+# and the worst event-loop stall seen meanwhile. The recommendation is the smallest pool that sustains the
+# target login rate with the given headroom; beyond the number of cores, larger pools only add queueing.
+#
+# Usage: python password_benchmark.py --target-rps 50 --logins 400
+#        python password_benchmark.py --n 32768 --pool-sizes 1,2,4,8 --output passwords.json
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from api import PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_P, PASSWORD_SCRYPT_R, hash_password_sync, verify_password_sync
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+# Measures how late a 10 ms timer fires while the burst runs; large values mean the loop was blocked
+async def loop_lag_monitor(stop: asyncio.Event, worst: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        worst[0] = max(worst[0], time.perf_counter() - start - 0.01)
+
+
+async def run_burst(pool_size, stored_hash, password, logins):
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=pool_size)
+    latencies = []
+    worst_lag = [0.0]
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(loop_lag_monitor(stop, worst_lag))
+
+    async def one_login():
+        start = time.perf_counter()
+        ok = await loop.run_in_executor(executor, verify_password_sync, stored_hash, password)
+        latencies.append(time.perf_counter() - start)
+        assert ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_login() for _ in range(logins)))
+    wall = time.perf_counter() - start
+    stop.set()
+    await monitor
+    executor.shutdown()
+    latencies.sort()
+    return {
+        "pool_size": pool_size,
+        "logins_per_second": round(logins / wall, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "max_loop_lag_ms": round(worst_lag[0] * 1000, 1),
+    }
+
+
+async def main(args):
+    password = "correct horse battery staple"
+    stored_hash = hash_password_sync(password, n=args.n, r=args.r, p=args.p)
+
+    start = time.perf_counter()
+    for _ in range(5):
+        verify_password_sync(stored_hash, password)
+    single_ms = (time.perf_counter() - start) / 5 * 1000
+
+    results = []
+    for pool_size in args.pool_sizes:
+        result = await run_burst(pool_size, stored_hash, password, args.logins)
+        results.append(result)
+        print(result)
+
+    needed = args.target_rps * (1 + args.headroom)
+    recommended = next((result["pool_size"] for result in results if result["logins_per_second"] >= needed), None)
+    return {
+        "cost": {"n": args.n, "r": args.r, "p": args.p, "memory_mib": round(128 * args.n * args.r * args.p / 2 ** 20, 1)},
+        "cpu_count": os.cpu_count(),
+        "single_verify_ms": round(single_ms, 1),
+        "target_rps": args.target_rps,
+        "headroom": args.headroom,
+        "pools": results,
+        "recommended_pool_size": recommended,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Size PASSWORD_HASH_WORKERS for a target login rate")
+    parser.add_argument("--n", type=int, default=PASSWORD_SCRYPT_N)
+    parser.add_argument("--r", type=int, default=PASSWORD_SCRYPT_R)
+    parser.add_argument("--p", type=int, default=PASSWORD_SCRYPT_P)
+    parser.add_argument("--logins", type=int, default=200, help="verifications per burst")
+    parser.add_argument("--pool-sizes", type=lambda value: [int(size) for size in value.split(",")],
+                        default=sorted({1, 2, 4, os.cpu_count() or 1, 2 * (os.cpu_count() or 1)}))
+    parser.add_argument("--target-rps", type=float, default=50, help="peak logins per second per worker process")
+    parser.add_argument("--headroom", type=float, default=0.3, help="spare capacity required on top of the target")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args))
+    print(json.dumps(report, indent=2))
+    if report["recommended_pool_size"] is None:
+        print("No pool size reaches the target: lower the scrypt cost or add worker processes / cores.")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,163 @@
+# Worker-scaling benchmark: runs the API under gunicorn (gunicorn.conf.py, STATE_BACKEND=mongo) with 1, 2, 4 ...
+# workers against one local MongoDB and the fake upstreams, and measures GET /news/{username} throughput.
+# Feeds are built once up front, so the measured path is the per-request work (Mongo read, freshness check,
+# serialization) that additional workers should parallelize. Scaling efficiency is rps(n) / (n * rps(1)).
+#
+# Usage: python scaling_benchmark.py --workers 1,2,4 --users 200 --duration 20 --output scaling.json
+#
+# The load generator runs in this process; on small machines it can become the bottleneck before the API
+# does, so give it a core of its own; efficiency is only checked for worker counts up to the core count.
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import httpx
+
+from benchmark import BACKEND_DIR, backend_env, percentile, start_upstreams, stop_processes, wait_until_up
+
+
+async def seed_users(base_url, usernames):
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as http_client:
+        async def seed(index, username):
+            await http_client.post("/signup", json={
+                "username": username, "email": f"{username}@example.com", "password": "benchmark-password"
+            })
+            await http_client.put(f"/preferences/{username}", json={
+                "country": "us", "category": "general",
+                "sources": ["bbc-news,cnn", "techcrunch,the-verge", "espn"][index % 3],
+                "summaryStyle": "Brief", "frequency": 24,
+            })
+            # Builds and stores the feed, so the timed requests below all take the fresh-feed path
+            response = await http_client.get(f"/news/{username}")
+            response.raise_for_status()
+
+        semaphore = asyncio.Semaphore(20)
+
+        async def bounded(index, username):
+            async with semaphore:
+                await seed(index, username)
+
+        await asyncio.gather(*(bounded(index, username) for index, username in enumerate(usernames)))
+
+
+async def hammer(base_url, usernames, concurrency, duration):
+    latencies = []
+    errors = 0
+    names = itertools.cycle(usernames)
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits) as http_client:
+        async def client_loop():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await http_client.get(f"/news/{next(names)}")
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / wall, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+async def run_for_workers(args, upstream_url, workers):
+    db_name = f"news_app_scaling_{datetime.now().strftime('%Y%m%d%H%M%S')}_{workers}"
+    env = {
+        **backend_env(args, upstream_url, db_name, workers),
+        "STATE_BACKEND": "mongo",
+        "WEB_CONCURRENCY": str(workers),
+        "PORT": str(args.api_port),
+        "PODCAST_PRECOMPUTE_ENABLED": "false",
+    }
+    api = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "api:fast_app"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{args.api_port}"
+    try:
+        await wait_until_up(f"{base_url}/readyz", api)
+        # /readyz is answered by whichever worker accepts the connection; give the others a moment too
+        await asyncio.sleep(2)
+        usernames = [f"scale_{workers}_{number}" for number in range(args.users)]
+        await seed_users(base_url, usernames)
+        await hammer(base_url, usernames, args.concurrency, min(3, args.duration))  # warm-up, not recorded
+        result = await hammer(base_url, usernames, args.concurrency, args.duration)
+    finally:
+        stop_processes([api])
+        if not args.keep_data:
+            from pymongo import MongoClient
+            MongoClient(args.mongo_uri).drop_database(db_name)
+    return {"workers": workers, **result}
+
+
+async def main(args):
+    upstream_url, upstreams = start_upstreams(args)
+    try:
+        await wait_until_up(f"{upstream_url}/stats", upstreams)
+        runs = []
+        for workers in args.workers:
+            result = await run_for_workers(args, upstream_url, workers)
+            print(result)
+            runs.append(result)
+    finally:
+        stop_processes([upstreams])
+    baseline = next((run["rps"] for run in runs if run["workers"] == 1), None)
+    for run in runs:
+        run["scaling_efficiency"] = round(run["rps"] / (run["workers"] * baseline), 2) if baseline else None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "cpu_count": os.cpu_count(),
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "duration_seconds": args.duration,
+        "runs": runs,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure /news/{username} throughput as gunicorn workers are added")
+    parser.add_argument("--workers", type=lambda value: [int(count) for count in value.split(",")], default=[1, 2, 4])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--mongo-uri", default="mongodb://127.0.0.1:27017")
+    parser.add_argument("--api-port", type=int, default=8300)
+    parser.add_argument("--upstream-port", type=int, default=9300)
+    parser.add_argument("--news-latency-ms", type=float, default=150)
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--tts-latency-ms", type=float, default=500)
+    parser.add_argument("--mail-latency-ms", type=float, default=50)
+    parser.add_argument("--min-efficiency", type=float, default=0.7,
+                        help="exit 1 if any run scales worse than this (only meaningful with enough cores)")
+    parser.add_argument("--keep-data", action="store_true")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    usable = [run for run in report["runs"] if run["workers"] <= (os.cpu_count() or 1)]
+    if any(run["scaling_efficiency"] is not None and run["scaling_efficiency"] < args.min_efficiency for run in usable):
+        sys.exit(1)
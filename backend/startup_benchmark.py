@@ -0,0 +1,109 @@
+# Measures how long the backend takes to start: importing api.py in a fresh interpreter, and how long a
+# uvicorn worker takes to answer /healthz (serving) and /readyz (Mongo warmed up). Each figure is the
+# median of several cold starts. Results are printed as JSON so they can be compared between releases.
+#
+# Usage: python startup_benchmark.py --runs 5 --mongo-uri mongodb://127.0.0.1:27017 --output startup.json
+#        python startup_benchmark.py --import-profile   # slowest modules from `python -X importtime`
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+IMPORT_SNIPPET = "import time; start = time.perf_counter(); import api; print(time.perf_counter() - start)"
+
+
+def backend_env(mongo_uri):
+    return {**os.environ, "MONGO_URI": mongo_uri, "MONGO_TLS": "false", "DIGEST_SCHEDULER_ENABLED": "false"}
+
+
+def measure_import(env):
+    output = subprocess.check_output([sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=env, text=True)
+    return float(output.strip().splitlines()[-1])
+
+
+# Starts one uvicorn worker and returns the seconds until /healthz and /readyz first answer 200
+def measure_server_start(env, port, timeout):
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:fast_app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    timings = {}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1) as http_client:
+            while len(timings) < 2 and time.perf_counter() - start < timeout:
+                if process.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+                for path in ("/healthz", "/readyz"):
+                    if path in timings:
+                        continue
+                    try:
+                        if http_client.get(path).status_code == 200:
+                            timings[path] = time.perf_counter() - start
+                    except httpx.HTTPError:
+                        pass
+                time.sleep(0.02)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return timings.get("/healthz"), timings.get("/readyz")
+
+
+def import_profile(env, top):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import api"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = [part.strip() for part in line.split("|")]
+        if not name.startswith("  "):  # top-level imports only, so nested packages aren't counted twice
+            rows.append((int(cumulative_us), name.strip()))
+    rows.sort(reverse=True)
+    return [{"module": name, "cumulative_ms": round(us / 1000, 1)} for us, name in rows[:top]]
+
+
+def median_or_none(values):
+    values = [value for value in values if value is not None]
+    return round(statistics.median(values), 3) if values else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure backend cold-start time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--mongo-uri", default="mongodb://127.0.0.1:27017")
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--import-profile", action="store_true", help="also list the slowest top-level imports")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    args = parser.parse_args()
+
+    env = backend_env(args.mongo_uri)
+    imports = [measure_import(env) for _ in range(args.runs)]
+    starts = [measure_server_start(env, args.port, args.timeout) for _ in range(args.runs)]
+    results = {
+        "runs": args.runs,
+        "import_seconds": median_or_none(imports),
+        "healthz_seconds": median_or_none([healthz for healthz, _ in starts]),
+        "readyz_seconds": median_or_none([readyz for _, readyz in starts]),
+        "readyz_failures": sum(1 for _, readyz in starts if readyz is None),
+    }
+    if args.import_profile:
+        results["slowest_imports"] = import_profile(env, 15)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -77,20 +77,14 @@ function Profile({ username, onNavigatetoPreferences, themeMode }) {
   useEffect(() => {
     const fetchData = async () => {
       try {
-        const preferencesResponse = await fetch(`${process.env.REACT_APP_BACKEND_URL}/user/${username}`);
-        if (!preferencesResponse.ok) throw new Error("Unable to fetch preferences");
-        const preferencesData = await preferencesResponse.json();
-        setPreferences(preferencesData.preferences);
-
-        const statisticsResponse = await fetch(`${process.env.REACT_APP_BACKEND_URL}/news/${username}/statistics`);
-        if (!statisticsResponse.ok) throw new Error("Unable to fetch statistics");
-        const statisticsData = await statisticsResponse.json();
-        setStatistics(statisticsData);
-
-        const streakResponse = await fetch(`${process.env.REACT_APP_BACKEND_URL}/streak/${username}`);
-        if (!streakResponse.ok) throw new Error("Unable to fetch streak");
-        const streakData = await streakResponse.json();
-        setStreak(streakData.streak);
+        // Preferences, statistics and streak all come back from one dashboard request
+        const dashboardResponse = await fetch(`${process.env.REACT_APP_BACKEND_URL}/dashboard/${username}`);
+        if (!dashboardResponse.ok) throw new Error("Unable to fetch dashboard");
+        const dashboardData = await dashboardResponse.json();
+        if (!dashboardData.statistics) throw new Error("Unable to fetch statistics");
+        setPreferences(dashboardData.preferences);
+        setStatistics(dashboardData.statistics);
+        setStreak(dashboardData.streak);
 
         setLoading(false);
       } catch (err) {